@@ -0,0 +1,169 @@
+# build_question_bank.py - Batch question bank builder
+"""Build question banks for every PDF and text file in a course folder.
+
+Usage:
+    python build_question_bank.py path/to/course --types mcq tf --num-questions 10
+
+Progress is checkpointed per file, so an interrupted run picks up where it
+left off and only redoes documents that were not finished (or that changed).
+
+Questions are generated from the first 2000 characters of each document,
+the same material a single generation prompt sees.
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from modules.database import get_database
+from modules.document_loader import extract_text
+from modules.question_generator import QuestionGenerator, MAX_CONTENT_CHARS
+from modules.retrieval_index import document_hash
+
+load_dotenv()
+
+FILE_TYPES = {
+    '.pdf': "application/pdf",
+    '.txt': "text/plain",
+    '.md': "text/plain"
+}
+
+
+class Checkpoint:
+    """Per-file progress stored as JSON next to the course material"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+
+    def is_done(self, rel_path, content_hash):
+        entry = self.entries.get(rel_path)
+        return bool(entry) and entry.get('status') == 'done' and entry.get('content_hash') == content_hash
+
+    def record(self, rel_path, **fields):
+        with self._lock:
+            self.entries[rel_path] = {**fields, 'updated_at': datetime.now().isoformat()}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def find_documents(root):
+    """All supported files under root, sorted for a stable order"""
+    documents = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if os.path.splitext(name)[1].lower() in FILE_TYPES:
+                documents.append(os.path.join(dirpath, name))
+    return sorted(documents)
+
+
+def read_document(path):
+    """Extract text with the same loader the upload pages use"""
+    with open(path, 'rb') as f:
+        return extract_text(f, FILE_TYPES[os.path.splitext(path)[1].lower()])
+
+
+def process_document(generator, checkpoint, root, path, args, llm_pool=None):
+    """Generate every requested question type for one document"""
+    rel_path = os.path.relpath(path, root)
+    text = read_document(path)
+    content_hash = document_hash(text)
+
+    if checkpoint.is_done(rel_path, content_hash):
+        return rel_path, 'skipped', {}
+
+    if len(text.strip()) < 50:
+        checkpoint.record(rel_path, status='done', content_hash=content_hash, questions={}, note='too short')
+        return rel_path, 'too short', {}
+
+    counts = {}
+    for question_type in args.types:
+        questions = generator.generate(text, question_type, args.num_questions, user_id=args.user_id,
+                                       executor=llm_pool)
+        if not questions:
+            checkpoint.record(rel_path, status='failed', content_hash=content_hash, questions=counts,
+                              error=f"no {question_type} questions generated")
+            return rel_path, 'failed', counts
+        counts[question_type] = len(questions)
+
+    checkpoint.record(rel_path, status='done', content_hash=content_hash, questions=counts)
+    return rel_path, 'done', counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build question banks for a folder of study material",
+        epilog=f"Only the first {MAX_CONTENT_CHARS} characters of each document are used to generate questions."
+    )
+    parser.add_argument("directory", help="Folder containing PDF / TXT / MD files")
+    parser.add_argument("--types", nargs="+", choices=["mcq", "tf", "sa"], default=["mcq", "tf", "sa"],
+                        help="Question types to generate (default: all)")
+    parser.add_argument("--num-questions", type=int, default=10, help="Questions per type per document")
+    parser.add_argument("--concurrency", type=int, default=3,
+                        help="Documents processed, and LLM requests in flight, at the same time")
+    parser.add_argument("--user-id", default="instructor", help="Owner recorded on banked questions")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <directory>/.question_bank_checkpoint.json)")
+    args = parser.parse_args(argv)
+
+    if not os.getenv("GROQ_API_KEY"):
+        print("⚠️ GROQ_API_KEY not found in .env file!")
+        return 1
+
+    root = os.path.abspath(args.directory)
+    if not os.path.isdir(root):
+        print(f"❌ Not a directory: {root}")
+        return 1
+
+    documents = find_documents(root)
+    if not documents:
+        print("No PDF or text files found.")
+        return 0
+
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(root, ".question_bank_checkpoint.json"))
+    database = get_database()
+    database.wait_for_mongodb(timeout=30)
+    generator = QuestionGenerator(database=database)
+
+    print(f"📚 Building question bank for {len(documents)} documents...")
+    failures = 0
+    concurrency = max(1, args.concurrency)
+    # Every document's LLM calls share one pool, so --concurrency caps requests in flight
+    with ThreadPoolExecutor(max_workers=concurrency) as pool, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='llm') as llm_pool:
+        futures = {
+            pool.submit(process_document, generator, checkpoint, root, path, args, llm_pool): path
+            for path in documents
+        }
+        for future in as_completed(futures):
+            rel_path = os.path.relpath(futures[future], root)
+            try:
+                rel_path, status, counts = future.result()
+            except Exception as e:
+                failures += 1
+                checkpoint.record(rel_path, status='failed', error=str(e))
+                print(f"❌ {rel_path}: {e}")
+                continue
+
+            if status == 'failed':
+                failures += 1
+            summary = ", ".join(f"{n} {t}" for t, n in counts.items())
+            print(f"{'✅' if status == 'done' else '⏭️' if status == 'skipped' else '⚠️'} {rel_path}: {status}"
+                  + (f" ({summary})" if summary else ""))
+
+    print(f"Finished: {len(documents) - failures} ok, {failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# modules/chunk_cache.py
+import os
+import re
+import json
+import hashlib
+from datetime import datetime
+
+
+def _normalize(text):
+    """Collapse whitespace so re-pasted notes hash the same"""
+    return ' '.join(text.split())
+
+
+def chunk_hash(text):
+    """Content hash of a single chunk"""
+    return hashlib.sha256(_normalize(text).encode('utf-8')).hexdigest()
+
+
+def _split_units(text, max_chars):
+    """Split text into paragraphs, falling back to sentences for very long ones"""
+    units = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            units.append(paragraph)
+            continue
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            if sentence.strip():
+                units.append(sentence.strip())
+    return units
+
+
+def paragraph_hashes(text, max_chars=2000):
+    """Hashes of the paragraphs (or long-paragraph sentences) of the text"""
+    return [chunk_hash(unit) for unit in _split_units(text, max_chars)]
+
+
+def content_defined_chunks(text, min_chars=400, max_chars=2000, divisor=4):
+    """Group text into chunks whose boundaries depend only on local content.
+
+    A chunk ends after a unit whose own hash is divisible by ``divisor`` once
+    the chunk holds at least ``min_chars``, so inserting a paragraph only
+    changes the chunk it lands in instead of shifting every later boundary.
+    """
+    chunks = []
+    current = []
+    size = 0
+
+    for unit in _split_units(text, max_chars):
+        if current and size + len(unit) > max_chars:
+            chunks.append('\n\n'.join(current))
+            current, size = [], 0
+
+        current.append(unit)
+        size += len(unit)
+
+        if size >= min_chars and int(chunk_hash(unit)[:8], 16) % divisor == 0:
+            chunks.append('\n\n'.join(current))
+            current, size = [], 0
+
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+class ChunkQuestionStore:
+    """Remembers which questions were generated from which chunk"""
+
+    def __init__(self, store_dir=os.path.join("data", "chunk_questions")):
+        self.store_dir = store_dir
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    def _path(self, question_type, digest):
+        return os.path.join(self.store_dir, f"{question_type}_{digest}.json")
+
+    def get(self, question_type, digest):
+        """Get questions previously generated for a chunk, or None"""
+        path = self._path(question_type, digest)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f).get('questions')
+        except Exception as e:
+            print(f"Error reading chunk questions: {e}")
+            return None
+
+    def put(self, question_type, digest, questions):
+        """Store the questions generated for a chunk"""
+        data = {
+            'chunk_hash': digest,
+            'question_type': question_type,
+            'questions': questions,
+            'created_at': datetime.now().isoformat()
+        }
+        path = self._path(question_type, digest)
+        try:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            print(f"Error saving chunk questions: {e}")
+            return False
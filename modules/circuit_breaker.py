@@ -0,0 +1,99 @@
+# modules/circuit_breaker.py
+import time
+import threading
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend that is known to be failing"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"LLM backend unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Classic closed / open / half-open circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast for ``cooldown`` seconds. Then a single trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, cooldown=30.0, metrics=None, name='llm'):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.metrics = metrics
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self._state = self.CLOSED
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def retry_after(self):
+        """Seconds until the next trial call is allowed"""
+        with self._lock:
+            if self._current_state() != self.OPEN:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            retry_after = self.cooldown - (time.monotonic() - self.opened_at) if state == self.OPEN else 1.0
+        if self.metrics is not None:
+            self.metrics.inc('circuit_breaker_rejections_total', breaker=self.name)
+        raise CircuitOpenError(max(0.0, retry_after))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            self._state = self.CLOSED
+
+    def release_trial(self):
+        """Give back a half-open trial slot for a call that got no answer"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self._state != self.OPEN and self.metrics is not None:
+                    self.metrics.inc('circuit_breaker_opened_total', breaker=self.name)
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name='llm', failure_threshold=5, cooldown=30.0, metrics=None):
+    """Get the process-wide breaker for a backend, created on first use"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(failure_threshold, cooldown, metrics=metrics, name=name)
+        return _breakers[name]
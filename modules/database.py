@@ -1,123 +1,716 @@
 # modules/database.py
 import os
-from datetime import datetime
+import time
+import uuid
+import gzip
+import base64
+import threading
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import json
 
+from modules.embeddings import get_embedder, cosine_similarities
+from modules.retrieval_index import document_hash
+from modules.jsonl_log import JsonlLog, KeyIndex, file_lock, migrate_json_file
+from modules.sqlite_store import SQLiteStore, import_json_storage, encode_row, decode_row
+from modules.write_behind import WriteBehindQueue
+from modules.read_cache import ReadCache
+
 load_dotenv()
 
 # Check if MongoDB is available
 try:
-    from pymongo import MongoClient
-    from pymongo.errors import ConnectionFailure
+    from pymongo import MongoClient, UpdateOne, ASCENDING, DESCENDING
+    from pymongo.errors import PyMongoError, ServerSelectionTimeoutError, BulkWriteError
+    from bson import ObjectId
     MONGODB_AVAILABLE = True
 except ImportError:
     MONGODB_AVAILABLE = False
     print("Warning: pymongo not installed. Using fallback JSON storage.")
+    ASCENDING, DESCENDING = 1, -1
+
+# Indexes every query shape below relies on: collection -> [(keys, options)]
+MONGODB_INDEXES = {
+    'quiz_results': [
+        # _id breaks ties between results completed at the same instant (keyset pagination)
+        ([('user_id', ASCENDING), ('completed_at', DESCENDING), ('_id', DESCENDING)], {'name': 'user_completed_at_id'}),
+        # Matching imported and synced results on their stable id
+        ([('user_id', ASCENDING), ('result_id', ASCENDING)], {'name': 'user_result_id'}),
+    ],
+    'flashcard_progress': [
+        ([('user_id', ASCENDING)], {'name': 'user_unique', 'unique': True}),
+    ],
+    'question_bank': [
+        ([('content_hash', ASCENDING), ('question_type', ASCENDING), ('created_at', ASCENDING)],
+         {'name': 'material_type_created_at'}),
+        # Exporting a user's data
+        ([('user_id', ASCENDING)], {'name': 'user'}),
+    ],
+    'daily_rollups': [
+        ([('user_id', ASCENDING), ('day', ASCENDING)], {'name': 'user_day_unique', 'unique': True}),
+    ],
+    'generation_jobs': [
+        ([('job_id', ASCENDING)], {'name': 'job_unique', 'unique': True}),
+        ([('user_id', ASCENDING), ('created_at', DESCENDING)], {'name': 'user_created_at'}),
+        ([('status', ASCENDING), ('created_at', ASCENDING)], {'name': 'status_created_at'}),
+    ],
+}
+
+# Indexes replaced by one above, dropped by ensure_indexes: collection -> [name]
+MONGODB_DROPPED_INDEXES = {
+    'quiz_results': ['user_completed_at'],  # superseded by user_completed_at_id
+}
+
+# MongoDB client tuning; connecting and health checks happen in a background thread
+MONGODB_CLIENT_OPTIONS = {
+    'maxPoolSize': int(os.getenv("MONGODB_MAX_POOL_SIZE", "50")),
+    'minPoolSize': int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+    'maxIdleTimeMS': int(os.getenv("MONGODB_MAX_IDLE_MS", "60000")),
+    'serverSelectionTimeoutMS': int(os.getenv("MONGODB_SERVER_SELECTION_MS", "5000")),
+    'connectTimeoutMS': int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000")),
+}
+MONGODB_COMPRESSORS = os.getenv("MONGODB_COMPRESSORS", "")  # e.g. "zstd,snappy,zlib"
+MONGODB_HEALTH_INTERVAL = float(os.getenv("MONGODB_HEALTH_INTERVAL", "30"))
+# Local writes are copied to MongoDB from this long before local storage took over,
+# to catch queued results written locally after their completed_at
+LOCAL_SYNC_MARGIN = timedelta(hours=1)
+
+# Flashcard logs hold one snapshot per save; compact once they grow past this
+FLASHCARD_COMPACT_LINES = 50
+
+# Fields a history listing needs; summary reads leave out answers and scores
+QUIZ_SUMMARY_FIELDS = ('completed_at', 'questions_count', 'total_score', 'time_spent')
+
+# Records per bulk write / transaction when importing NDJSON
+IMPORT_CHUNK_SIZE = 1000
+
+# Natural keys that make imports idempotent across backends: record type -> key fields.
+# Quiz results are matched on RESULT_ID_KEY instead when they carry a result_id;
+# the natural key is only for exports written before results had one
+IMPORT_KEYS = {
+    'quiz_result': ('user_id', 'completed_at'),
+    'flashcard_progress': ('user_id',),
+    'question': ('user_id', 'content_hash', 'question_type', 'created_at'),
+}
+RESULT_ID_KEY = ('user_id', 'result_id')
+
+# Quiz results are written in batches every interval (0 writes each one synchronously)
+QUIZ_WRITE_BEHIND_INTERVAL = float(os.getenv("QUIZ_WRITE_BEHIND_INTERVAL", "0.5"))
+QUIZ_WRITE_BEHIND_BATCH = int(os.getenv("QUIZ_WRITE_BEHIND_BATCH", "100"))
+# Failed writes of one result before it is moved to the dead-letter log
+QUIZ_WRITE_MAX_ATTEMPTS = int(os.getenv("QUIZ_WRITE_MAX_ATTEMPTS", "5"))
+# Progress the writer keeps on queued records so a retry redoes nothing; never stored
+WRITE_STATE_FIELDS = ('_mongo_id', '_json_state')
+
+# Representative query shapes checked by Database.explain_queries()
+# (collection, filter, sort)
+MONGODB_QUERY_SHAPES = [
+    ('quiz_results', {'user_id': '?'}, [('completed_at', DESCENDING)]),
+    ('quiz_results', {'user_id': '?', 'result_id': '?'}, None),
+    ('quiz_results', {'user_id': '?', '$or': [{'completed_at': {'$lt': '?'}},
+                                            {'completed_at': '?', '_id': {'$lt': '?'}}]},
+     [('completed_at', DESCENDING), ('_id', DESCENDING)]),
+    ('flashcard_progress', {'user_id': '?'}, None),
+    ('daily_rollups', {'user_id': '?', 'day': {'$gte': '?', '$lte': '?'}}, [('day', ASCENDING)]),
+    ('question_bank', {'content_hash': '?', 'question_type': '?'}, [('created_at', ASCENDING)]),
+    ('question_bank', {'user_id': '?'}, None),
+    ('generation_jobs', {'job_id': '?'}, None),
+    ('generation_jobs', {'user_id': '?'}, [('created_at', DESCENDING)]),
+    ('generation_jobs', {'status': {'$in': ['queued', 'running']}}, [('created_at', ASCENDING)]),
+]
 
 class Database:
     def __init__(self):
         """Initialize database connection"""
         self.use_mongodb = False
+        self.use_sqlite = False
+        self.data_dir = "data"
         
-        if MONGODB_AVAILABLE:
-            mongodb_uri = os.getenv("MONGODB_URI")
-            
-            if mongodb_uri:
-                try:
-                    self.client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=5000)
-                    # Test connection
-                    self.client.server_info()
-                    self.db = self.client['study_assistant']
-                    self.use_mongodb = True
-                    print("✅ Connected to MongoDB")
-                except ConnectionFailure:
-                    print("⚠️ MongoDB connection failed. Using JSON fallback.")
-                    self.use_mongodb = False
-            else:
-                print("⚠️ MONGODB_URI not found. Using JSON fallback.")
+        # Local storage serves requests right away: SQLite unless JSON files are requested
+        os.makedirs(self.data_dir, exist_ok=True)
+        self._migrate_json_files()
+        
+        if os.getenv("LOCAL_STORAGE", "sqlite").lower() != "json":
+            try:
+                self.sql = SQLiteStore()
+                self.use_sqlite = True
+                print(f"✅ Using SQLite at {self.sql.path}")
+                import_json_storage(self.sql, self.data_dir)
+            except Exception as e:
+                print(f"⚠️ SQLite unavailable ({e}). Using JSON fallback.")
+                self.use_sqlite = False
+        
+        self.read_cache = ReadCache()
+        self.quiz_writes = None
+        if QUIZ_WRITE_BEHIND_INTERVAL > 0:
+            self.quiz_writes = WriteBehindQueue(
+                self._write_quiz_results,
+                interval=QUIZ_WRITE_BEHIND_INTERVAL,
+                max_batch=QUIZ_WRITE_BEHIND_BATCH,
+                name='quiz-results-writer',
+                dead_letter=self._dead_letter_quiz_results,
+                max_attempts=QUIZ_WRITE_MAX_ATTEMPTS
+            )
+        
+        self._ensure_user_summaries()
+        
+        # MongoDB is switched to once the background health check reaches it
+        self._mongodb_checked = threading.Event()
+        mongodb_uri = os.getenv("MONGODB_URI")
+        if not MONGODB_AVAILABLE:
+            self._mongodb_checked.set()
+        elif not mongodb_uri:
+            print("⚠️ MONGODB_URI not found. Using local storage.")
+            self._mongodb_checked.set()
+        else:
+            options = dict(MONGODB_CLIENT_OPTIONS)
+            if MONGODB_COMPRESSORS:
+                options['compressors'] = MONGODB_COMPRESSORS
+            try:
+                # Constructing the client does not block; it connects in the background
+                self.client = MongoClient(mongodb_uri, **options)
+                # Quiz results wait for the first health check instead of landing locally
+                if self.quiz_writes is not None:
+                    self.quiz_writes.hold()
+                self._mark_local_writes()
+                threading.Thread(target=self._monitor_mongodb, name='mongodb-health', daemon=True).start()
+            except (PyMongoError, ValueError) as e:
+                print(f"⚠️ Invalid MongoDB configuration ({e}). Using local storage.")
+                self._mongodb_checked.set()
+    
+    def _monitor_mongodb(self):
+        """Health-check loop that switches to MongoDB and back as it comes and goes"""
+        while True:
+            try:
+                self._check_mongodb()
+            except Exception as e:
+                print(f"Error checking MongoDB: {e}")
+            if not self._mongodb_checked.is_set():
+                if self.quiz_writes is not None:
+                    self.quiz_writes.release()
+                self._mongodb_checked.set()
+            time.sleep(MONGODB_HEALTH_INTERVAL)
+    
+    def _check_mongodb(self):
+        try:
+            self.client.admin.command('ping')
+        except (ServerSelectionTimeoutError, PyMongoError) as e:
+            if self.use_mongodb:
+                self._mark_local_writes()
+                self.use_mongodb = False
+                self.read_cache.clear()
+                print(f"⚠️ Lost MongoDB connection ({e}). Using local storage.")
+            elif not self._mongodb_checked.is_set():
+                print("⚠️ MongoDB connection failed. Using local storage.")
+            return
         
-        # Fallback to JSON files if MongoDB not available
         if not self.use_mongodb:
-            self.data_dir = "data"
-            os.makedirs(self.data_dir, exist_ok=True)
+            self.db = self.client['study_assistant']
+            self.use_mongodb = True
+            self.read_cache.clear()
+            print("✅ Connected to MongoDB")
+            self.ensure_indexes()
+            self._ensure_user_summaries()
+            if self.quiz_writes is not None:
+                # Let a batch that was already being written locally finish first
+                self.quiz_writes.flush()
+        
+        # Retried on every check until it succeeds
+        self._sync_local_writes()
     
-    def save_questions(self, user_id, questions, question_type, content):
-        """Save generated questions to database"""
-        data = {
-            'user_id': user_id,
-            'questions': questions,
-            'question_type': question_type,
-            'content': content[:500],  # Store first 500 chars
-            'created_at': datetime.now().isoformat()
-        }
+    def _sync_file(self):
+        return os.path.join(self.data_dir, "mongodb_sync.json")
+    
+    def _mark_local_writes(self):
+        """Remember that local storage takes writes while MongoDB is configured"""
+        path = self._sync_file()
+        if os.path.exists(path):
+            return
+        try:
+            with open(path, 'w') as f:
+                json.dump({'since': (datetime.now() - LOCAL_SYNC_MARGIN).isoformat()}, f)
+        except Exception as e:
+            print(f"Error marking local writes: {e}")
+    
+    def _sync_local_writes(self):
+        """Copy what local storage took while MongoDB was unreachable into MongoDB.
+        
+        Records are upserted on their natural keys, so copying one twice is
+        harmless; the marker is only removed once everything got across.
+        """
+        path = self._sync_file()
+        if not self.use_mongodb or not os.path.exists(path):
+            return 0
+        
+        try:
+            with open(path, 'r') as f:
+                since = json.load(f)['since']
+            
+            synced = 0
+            users = set()
+            chunks = {}
+            for record_type, record in self._iter_local_records(since):
+                if record_type in ('quiz_result', 'flashcard_progress'):
+                    users.add(record['user_id'])
+                chunk = chunks.setdefault(record_type, [])
+                chunk.append(record)
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    self._upsert_mongodb(record_type, chunk)
+                    synced += len(chunk)
+                    chunks[record_type] = []
+            for record_type, chunk in chunks.items():
+                if chunk:
+                    self._upsert_mongodb(record_type, chunk)
+                    synced += len(chunk)
+            
+            if users:
+                self.rebuild_user_summaries(sorted(users))
+            os.remove(path)
+            if synced:
+                print(f"Copied {synced} locally written records to MongoDB")
+            return synced
+        except Exception as e:
+            print(f"Error copying local writes to MongoDB: {e}")
+            return 0
+    
+    def _iter_local_records(self, since):
+        """Yield (type, record) for what local storage took since an ISO timestamp"""
+        if self.use_sqlite:
+            with self.sql.connection() as conn:
+                for row in conn.execute("SELECT * FROM quiz_results WHERE completed_at >= ?", (since,)):
+                    record = decode_row('quiz_results', row)
+                    record.pop('id')
+                    yield 'quiz_result', record
+                for row in conn.execute("SELECT * FROM flashcard_progress WHERE updated_at >= ?", (since,)):
+                    yield 'flashcard_progress', decode_row('flashcard_progress', row)
+                for row in conn.execute("SELECT * FROM question_bank WHERE created_at >= ?", (since,)):
+                    record = decode_row('question_bank', row)
+                    record.pop('id')
+                    yield 'question', record
+                for row in conn.execute("SELECT * FROM generation_jobs WHERE updated_at >= ?", (since,)):
+                    yield 'generation_job', decode_row('generation_jobs', row)
+            return
         
+        # JSON fallback: logs are appended in time order, so read back only as far as needed
+        bank_dir = os.path.join(self.data_dir, "question_bank")
+        for name in sorted(os.listdir(self.data_dir)):
+            path = os.path.join(self.data_dir, name)
+            if name.startswith("quiz_results_") and name.endswith(".jsonl"):
+                for _, record in JsonlLog(path).reverse():
+                    if record.get('completed_at', '') < since:
+                        break
+                    yield 'quiz_result', result_from_json(record)
+            elif name.startswith("flashcards_") and name.endswith(".jsonl"):
+                record = JsonlLog(path).last()
+                if record and record.get('updated_at', '') >= since:
+                    yield 'flashcard_progress', record
+        if os.path.isdir(bank_dir):
+            for name in sorted(os.listdir(bank_dir)):
+                if name.endswith(".jsonl"):
+                    for _, record in JsonlLog(os.path.join(bank_dir, name)).reverse():
+                        if record.get('created_at', '') < since:
+                            break
+                        yield 'question', record
+        for job in self._iter_job_files():
+            if job.get('updated_at', '') >= since:
+                yield 'generation_job', job
+    
+    def wait_for_mongodb(self, timeout=None):
+        """Block until the first MongoDB health check has finished; True if connected"""
+        self._mongodb_checked.wait(timeout)
+        return self.use_mongodb
+    
+    @property
+    def backend(self):
+        """Name of the active storage backend"""
         if self.use_mongodb:
+            return 'mongodb'
+        return 'sqlite' if self.use_sqlite else 'json'
+    
+    def _migrate_json_files(self):
+        """One-time move of whole-file JSON storage to append-only JSON Lines"""
+        bank_dir = os.path.join(self.data_dir, "question_bank")
+        candidates = [os.path.join(self.data_dir, name) for name in os.listdir(self.data_dir)
+                      if name.startswith(("quiz_results_", "flashcards_"))]
+        if os.path.isdir(bank_dir):
+            candidates += [os.path.join(bank_dir, name) for name in os.listdir(bank_dir)]
+        
+        for json_path in candidates:
+            if not json_path.endswith(".json"):
+                continue
             try:
-                self.db.questions.insert_one(data)
-                return True
+                if migrate_json_file(json_path, f"{json_path}l"):
+                    print(f"Migrated {json_path} to JSON Lines")
             except Exception as e:
-                print(f"Error saving to MongoDB: {e}")
-                return False
-        else:
-            # JSON fallback
+                print(f"Error migrating {json_path}: {e}")
+    
+    def _log(self, kind, user_id):
+        """Append-only log for one user's quiz results or flashcard progress"""
+        return JsonlLog(os.path.join(self.data_dir, f"{kind}_{user_id}.jsonl"))
+    
+    def compact_json_storage(self):
+        """Rewrite JSON Lines files without torn lines and superseded snapshots"""
+        if self.use_mongodb or self.use_sqlite:
+            return 0
+        
+        compacted = 0
+        bank_dir = os.path.join(self.data_dir, "question_bank")
+        paths = [os.path.join(self.data_dir, name) for name in os.listdir(self.data_dir)]
+        if os.path.isdir(bank_dir):
+            paths += [os.path.join(bank_dir, name) for name in os.listdir(bank_dir)]
+        
+        for path in paths:
+            if not path.endswith(".jsonl"):
+                continue
             try:
-                file_path = os.path.join(self.data_dir, f"questions_{user_id}.json")
-                with open(file_path, 'w') as f:
-                    json.dump(data, f, indent=2)
-                return True
+                keep_last = os.path.basename(path).startswith("flashcards_")
+                JsonlLog(path).compact(keep_last=keep_last)
+                compacted += 1
             except Exception as e:
-                print(f"Error saving to JSON: {e}")
-                return False
+                print(f"Error compacting {path}: {e}")
+        return compacted
+    
+    def ensure_indexes(self):
+        """Create the declared MongoDB indexes and drop superseded ones (no-op if done)"""
+        if not self.use_mongodb:
+            return False
+        
+        ok = True
+        for collection, names in MONGODB_DROPPED_INDEXES.items():
+            try:
+                existing = self.db[collection].index_information()
+                for name in names:
+                    if name in existing:
+                        self.db[collection].drop_index(name)
+                        print(f"Dropped superseded index {name} on {collection}")
+            except Exception as e:
+                print(f"Error dropping superseded indexes on {collection}: {e}")
+                ok = False
+        
+        for collection, indexes in MONGODB_INDEXES.items():
+            for keys, options in indexes:
+                try:
+                    self.db[collection].create_index(keys, **options)
+                except Exception as e:
+                    print(f"Error creating index {options.get('name')} on {collection}: {e}")
+                    ok = False
+        return ok
+    
+    def explain_queries(self):
+        """Print and return an explain-plan summary for each query shape"""
+        if not self.use_mongodb:
+            print("Explain plans are only available with MongoDB.")
+            return []
+        
+        summaries = []
+        for collection, query, sort in MONGODB_QUERY_SHAPES:
+            try:
+                cursor = self.db[collection].find(query)
+                if sort:
+                    cursor = cursor.sort(sort)
+                plan = cursor.limit(10).explain()
+                
+                winning = plan.get('queryPlanner', {}).get('winningPlan', {})
+                stages = []
+                index_name = None
+                stage = winning
+                while stage:
+                    stages.append(stage.get('stage'))
+                    index_name = index_name or stage.get('indexName')
+                    stage = stage.get('inputStage') or (stage.get('inputStages') or [None])[0]
+                
+                execution = plan.get('executionStats', {})
+                summary = {
+                    'collection': collection,
+                    'query': query,
+                    'sort': sort,
+                    'stages': stages,
+                    'index': index_name,
+                    'collection_scan': 'COLLSCAN' in stages,
+                    'in_memory_sort': 'SORT' in stages,
+                    'keys_examined': execution.get('totalKeysExamined'),
+                    'docs_examined': execution.get('totalDocsExamined')
+                }
+            except Exception as e:
+                summary = {'collection': collection, 'query': query, 'error': str(e)}
+            
+            summaries.append(summary)
+            if 'error' in summary:
+                print(f"❌ {collection} {query}: {summary['error']}")
+            else:
+                status = "⚠️ COLLSCAN" if summary['collection_scan'] else f"✅ {summary['index']}"
+                print(f"{status} | {collection} {query} sort={sort} | {' <- '.join(summary['stages'])}")
+        return summaries
     
-    def save_quiz_result(self, user_id, questions, answers, scores, total_score):
-        """Save quiz results to database"""
+    def save_questions(self, user_id, questions, question_type, content):
+        """Save generated questions to the question bank"""
+        content_hash = document_hash(content)
+        inserted = self.add_to_question_bank(user_id, questions, question_type, content_hash)
+        return inserted is not None
+    
+    def _question_bank_file(self, question_type, content_hash):
+        """Path of the JSON question bank file for one piece of material"""
+        bank_dir = os.path.join(self.data_dir, "question_bank")
+        os.makedirs(bank_dir, exist_ok=True)
+        return os.path.join(bank_dir, f"{question_type}_{content_hash}.jsonl")
+    
+    def _load_bank_entries(self, question_type, content_hash, with_embeddings=True):
+        """Load banked entries for one piece of material.
+        
+        Embeddings are only needed for dedup; plain reads leave them out
+        so the vectors are not shipped from the database.
+        """
+        if self.use_mongodb:
+            projection = None if with_embeddings else {'embedding': 0}
+            return list(self.db.question_bank.find(
+                {'content_hash': content_hash, 'question_type': question_type}, projection
+            ).sort('created_at', 1))
+        
+        if self.use_sqlite:
+            columns = "*" if with_embeddings else "question, embedding_model, created_at"
+            rows = self.sql.query(
+                f"SELECT {columns} FROM question_bank WHERE content_hash = ? AND question_type = ? ORDER BY created_at",
+                (content_hash, question_type)
+            )
+            return [decode_row('question_bank', row) for row in rows]
+        
+        return list(JsonlLog(self._question_bank_file(question_type, content_hash)))
+    
+    def add_to_question_bank(self, user_id, questions, question_type, content_hash,
+                             similarity_threshold=0.9):
+        """Add questions to the bank, rejecting near-duplicates of banked ones.
+        
+        Returns the number of questions inserted, or None on error.
+        """
+        if not questions:
+            return 0
+        
+        try:
+            embedder = get_embedder()
+            existing = [e for e in self._load_bank_entries(question_type, content_hash)
+                        if e.get('embedding_model') == embedder.model_name]
+            known = [e['embedding'] for e in existing]
+            
+            vectors = embedder.embed([question_text(q) for q in questions])
+            new_entries = []
+            for question, vector in zip(questions, vectors):
+                similarities = cosine_similarities(vector, known)
+                if len(similarities) and similarities.max() >= similarity_threshold:
+                    continue
+                
+                known.append(vector.tolist())
+                new_entries.append({
+                    'user_id': user_id,
+                    'question_type': question_type,
+                    'content_hash': content_hash,
+                    'question': question,
+                    'embedding': vector.tolist(),
+                    'embedding_model': embedder.model_name,
+                    'created_at': datetime.now().isoformat()
+                })
+            
+            if not new_entries:
+                return 0
+            
+            if self.use_mongodb:
+                self.db.question_bank.insert_many(new_entries)
+            elif self.use_sqlite:
+                with self.sql.transaction() as conn:
+                    for entry in new_entries:
+                        self.sql.insert(conn, 'question_bank', entry)
+            else:
+                JsonlLog(self._question_bank_file(question_type, content_hash)).append_many(new_entries)
+            
+            return len(new_entries)
+        except Exception as e:
+            print(f"Error adding to question bank: {e}")
+            return None
+    
+    def get_banked_questions(self, content_hash, question_type, limit=None):
+        """Get banked questions generated from the same material"""
+        try:
+            entries = self._load_bank_entries(question_type, content_hash, with_embeddings=False)
+            questions = [e['question'] for e in entries]
+            return questions[:limit] if limit else questions
+        except Exception as e:
+            print(f"Error reading question bank: {e}")
+            return []
+    
+    def save_quiz_result(self, user_id, questions, answers, scores, total_score, time_spent=None):
+        """Save quiz results to database (time_spent in seconds)"""
         data = {
             'user_id': user_id,
             'questions_count': len(questions),
             'answers': answers,
             'scores': scores,
             'total_score': total_score,
-            'completed_at': datetime.now().isoformat()
+            'time_spent': time_spent,
+            'completed_at': datetime.now().isoformat(),
+            # Same on every backend, so exports and syncs can tell results apart
+            'result_id': uuid.uuid4().hex
         }
         
+        try:
+            # Reject what no backend can store now, not later in the background writer
+            json.dumps(data)
+        except (TypeError, ValueError) as e:
+            print(f"Error saving quiz result: {e}")
+            return False
+        
+        # Invalidate only after the write (or enqueue): a read that raced it then
+        # finds the generation bumped and does not cache what it saw before
+        if self.quiz_writes is not None:
+            # Written by the background flusher; reads of this user flush first
+            self.quiz_writes.put(user_id, data)
+            self.read_cache.invalidate(user_id)
+            return True
+        
+        try:
+            self._write_quiz_results([data])
+            return True
+        except Exception as e:
+            print(f"Error saving quiz result: {e}")
+            return False
+        finally:
+            self.read_cache.invalidate(user_id)
+    
+    def _dead_letter_quiz_results(self, failures):
+        """Keep quiz results that could not be written, for inspection or replay"""
+        log = JsonlLog(os.path.join(self.data_dir, "dead_letter_quiz_results.jsonl"))
+        log.append_many([
+            {'error': str(error), 'failed_at': datetime.now().isoformat(),
+             'record': json.loads(json.dumps(record, default=str))}
+            for record, error in failures
+        ])
+    
+    def _write_quiz_results(self, records):
+        """Insert a batch of quiz results and bump the users' summaries and daily rollups"""
+        now = datetime.now().isoformat()
+        
         if self.use_mongodb:
+            # The _id stays on the queued record, so a retried batch re-inserts nothing
+            docs = [{**{k: v for k, v in record.items() if k not in WRITE_STATE_FIELDS},
+                     '_id': record.setdefault('_mongo_id', ObjectId()), 'summary_state': 0}
+                    for record in records]
             try:
-                self.db.quiz_results.insert_one(data)
-                return True
-            except Exception as e:
-                print(f"Error saving quiz result: {e}")
-                return False
+                self.db.quiz_results.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                    raise
+            
+            # summary_state marks results whose increments are not applied yet (0: none,
+            # 1: user_stats) and is removed once both are, so a retry never counts twice
+            ids = [doc['_id'] for doc in docs]
+            fields = {'user_id': 1, 'questions_count': 1, 'total_score': 1, 'time_spent': 1, 'completed_at': 1}
+            pending = list(self.db.quiz_results.find({'_id': {'$in': ids}, 'summary_state': 0}, fields))
+            if pending:
+                increments, _ = summary_increments(pending)
+                self.db.user_stats.bulk_write([
+                    UpdateOne({'_id': user_id}, {'$inc': inc, '$set': {'updated_at': now}}, upsert=True)
+                    for user_id, inc in increments.items()
+                ], ordered=False)
+                self.db.quiz_results.update_many({'_id': {'$in': [doc['_id'] for doc in pending]}},
+                                                 {'$set': {'summary_state': 1}})
+            
+            pending = list(self.db.quiz_results.find({'_id': {'$in': ids}, 'summary_state': 1}, fields))
+            if pending:
+                _, daily = summary_increments(pending)
+                self.db.daily_rollups.bulk_write([
+                    UpdateOne({'user_id': user_id, 'day': day}, {'$inc': inc, '$set': {'updated_at': now}}, upsert=True)
+                    for (user_id, day), inc in daily.items()
+                ], ordered=False)
+                self.db.quiz_results.update_many({'_id': {'$in': [doc['_id'] for doc in pending]}},
+                                                 {'$unset': {'summary_state': ''}})
+            return
+        
+        originals = records
+        records = [{k: v for k, v in record.items() if k not in WRITE_STATE_FIELDS} for record in records]
+        # Also rejects a malformed record before anything is written
+        increments, daily = summary_increments(records)
+        if self.use_sqlite:
+            # Results and summaries commit together
+            with self.sql.transaction() as conn:
+                for record in records:
+                    self.sql.insert(conn, 'quiz_results', record)
+                for user_id, inc in increments.items():
+                    conn.execute(
+                        "INSERT INTO user_stats (user_id, total_quizzes, score_sum, total_questions_answered, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET "
+                        "total_quizzes = total_quizzes + excluded.total_quizzes, "
+                        "score_sum = score_sum + excluded.score_sum, "
+                        "total_questions_answered = total_questions_answered + excluded.total_questions_answered, "
+                        "updated_at = excluded.updated_at",
+                        (user_id, inc['total_quizzes'], inc['score_sum'], inc['total_questions_answered'], now)
+                    )
+                for (user_id, day), inc in daily.items():
+                    conn.execute(
+                        "INSERT INTO daily_rollups (user_id, day, quizzes, questions_answered, score_sum, time_spent, "
+                        "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(user_id, day) DO UPDATE SET "
+                        "quizzes = quizzes + excluded.quizzes, "
+                        "questions_answered = questions_answered + excluded.questions_answered, "
+                        "score_sum = score_sum + excluded.score_sum, "
+                        "time_spent = time_spent + excluded.time_spent, "
+                        "updated_at = excluded.updated_at",
+                        (user_id, day, inc['quizzes'], inc['questions_answered'], inc['score_sum'],
+                         inc['time_spent'], now)
+                    )
         else:
-            # JSON fallback
-            try:
-                file_path = os.path.join(self.data_dir, f"quiz_results_{user_id}.json")
-                
-                # Load existing results
-                results = []
-                if os.path.exists(file_path):
-                    with open(file_path, 'r') as f:
-                        results = json.load(f)
-                
-                # Append new result
-                results.append(data)
-                
-                # Save back
-                with open(file_path, 'w') as f:
-                    json.dump(results, f, indent=2)
-                
-                return True
-            except Exception as e:
-                print(f"Error saving quiz result to JSON: {e}")
-                return False
+            # JSON fallback: one append per user log. A later user can fail after
+            # earlier ones were written, so _json_state on the queued record keeps
+            # the steps already done (1: appended, 2: summary, 3: rollups)
+            by_user = {}
+            for original, record in zip(originals, records):
+                record.setdefault('_id', record.get('result_id') or uuid.uuid4().hex)
+                by_user.setdefault(record['user_id'], []).append((original, record))
+            
+            def not_done(items, step):
+                return [record for original, record in items if original.get('_json_state', 0) < step]
+            
+            def done(items, step):
+                for original, _ in items:
+                    original['_json_state'] = max(original.get('_json_state', 0), step)
+            
+            for user_id, items in by_user.items():
+                self._log("quiz_results", user_id).append_many(not_done(items, 1))
+                done(items, 1)
+                increments, _ = summary_increments(not_done(items, 2))
+                if user_id in increments:
+                    self._update_json_summary(user_id, inc=increments[user_id])
+                done(items, 2)
+                _, daily = summary_increments(not_done(items, 3))
+                for (_, day), inc in daily.items():
+                    self._update_json_rollup(user_id, day, inc)
+                done(items, 3)
+    
+    def _flush_user_writes(self, user_id):
+        """Read-your-writes: persist this user's queued quiz results"""
+        if self.quiz_writes is not None:
+            if self.quiz_writes.pending(user_id) and not self._mongodb_checked.is_set():
+                # Held until the first health check picks the backend (bounded by server selection)
+                self._mongodb_checked.wait(MONGODB_CLIENT_OPTIONS['serverSelectionTimeoutMS'] / 1000 + 1)
+            self.quiz_writes.flush_key(user_id)
+            if self.quiz_writes.pending(user_id):
+                # The flush failed, so this read is incomplete and must not be cached
+                self.read_cache.invalidate(user_id)
     
-    def get_quiz_history(self, user_id, limit=10):
-        """Get quiz history for a user"""
+    def get_quiz_history(self, user_id, limit=10, summary=False):
+        """Get quiz history for a user (cached until the user saves a result).
+        
+        With summary=True only the listing fields (QUIZ_SUMMARY_FIELDS and _id)
+        are read; use get_quiz_result for the answers and scores of one result.
+        """
+        return self.read_cache.get_or_load('quiz_history', user_id, (limit, summary),
+                                           lambda: self._read_quiz_history(user_id, limit, summary))
+    
+    def _read_quiz_history(self, user_id, limit, summary=False):
+        self._flush_user_writes(user_id)
+        
         if self.use_mongodb:
             try:
                 results = list(self.db.quiz_results.find(
-                    {'user_id': user_id}
-                ).sort('completed_at', -1).limit(limit))
+                    {'user_id': user_id},
+                    quiz_projection(summary)
+                ).sort([('completed_at', -1), ('_id', -1)]).limit(limit))
                 
                 # Convert ObjectId to string
                 for result in results:
@@ -127,19 +720,159 @@ class Database:
             except Exception as e:
                 print(f"Error getting quiz history: {e}")
                 return []
+        elif self.use_sqlite:
+            try:
+                rows = self.sql.query(
+                    f"SELECT {quiz_columns(summary)} FROM quiz_results WHERE user_id = ? "
+                    "ORDER BY completed_at DESC, id DESC LIMIT ?",
+                    (user_id, limit)
+                )
+                
+                results = []
+                for row in rows:
+                    result = decode_row('quiz_results', row)
+                    result['_id'] = str(result.pop('id'))
+                    results.append(result)
+                return results
+            except Exception as e:
+                print(f"Error getting quiz history: {e}")
+                return []
         else:
             # JSON fallback
             try:
-                file_path = os.path.join(self.data_dir, f"quiz_results_{user_id}.json")
-                if os.path.exists(file_path):
-                    with open(file_path, 'r') as f:
-                        results = json.load(f)
-                    return results[-limit:][::-1]  # Last 'limit' items, reversed
-                return []
+                results = self._log("quiz_results", user_id).tail(limit)
+                return [summarize_result(r) for r in results] if summary else results
             except Exception as e:
                 print(f"Error reading quiz history: {e}")
                 return []
     
+    def get_quiz_history_page(self, user_id, page_size=20, cursor=None, summary=False):
+        """One page of quiz history, newest first, using keyset pagination.
+        
+        Returns ``(results, next_cursor)``; pass ``next_cursor`` back to get
+        the following page. It is None after the last page. Every page is an
+        index range scan from the cursor, so deep pages cost the same as the first.
+        summary=True reads only the listing fields, as in get_quiz_history.
+        """
+        self._flush_user_writes(user_id)
+        
+        try:
+            after = decode_cursor(cursor) if cursor else None
+            
+            if self.use_mongodb:
+                query = {'user_id': user_id}
+                if after:
+                    completed_at, last_id = after[0], ObjectId(after[1])
+                    query['$or'] = [
+                        {'completed_at': {'$lt': completed_at}},
+                        {'completed_at': completed_at, '_id': {'$lt': last_id}}
+                    ]
+                results = list(self.db.quiz_results.find(query, quiz_projection(summary)).sort(
+                    [('completed_at', -1), ('_id', -1)]
+                ).limit(page_size + 1))
+                for result in results:
+                    result['_id'] = str(result['_id'])
+                
+                has_more = len(results) > page_size
+                results = results[:page_size]
+                next_cursor = None
+                if has_more:
+                    next_cursor = encode_cursor([results[-1]['completed_at'], results[-1]['_id']])
+                return results, next_cursor
+            
+            elif self.use_sqlite:
+                query = f"SELECT {quiz_columns(summary)} FROM quiz_results WHERE user_id = ?"
+                params = [user_id]
+                if after:
+                    query += " AND (completed_at, id) < (?, ?)"
+                    params += [after[0], int(after[1])]
+                query += " ORDER BY completed_at DESC, id DESC LIMIT ?"
+                rows = self.sql.query(query, (*params, page_size + 1))
+                
+                results = []
+                for row in rows:
+                    result = decode_row('quiz_results', row)
+                    result['_id'] = str(result.pop('id'))
+                    results.append(result)
+                
+                has_more = len(results) > page_size
+                results = results[:page_size]
+                next_cursor = None
+                if has_more:
+                    next_cursor = encode_cursor([results[-1]['completed_at'], results[-1]['_id']])
+                return results, next_cursor
+            
+            else:
+                # JSON fallback: the cursor also carries the byte offset of the last result
+                log = self._log("quiz_results", user_id)
+                end = None
+                skip_from = None
+                if after:
+                    last = log.read_at(after[2]) if len(after) > 2 else None
+                    if last is not None and [last.get('completed_at'), last.get('_id')] == after[:2]:
+                        end = after[2]
+                    else:
+                        # The log was compacted since the cursor was made; compare sort keys instead
+                        skip_from = (after[0], str(after[1]))
+                
+                page = []
+                for offset, record in log.reverse(end=end):
+                    if skip_from and (record.get('completed_at'), str(record.get('_id'))) >= skip_from:
+                        continue
+                    page.append((offset, record))
+                    if len(page) > page_size:
+                        break
+                
+                has_more = len(page) > page_size
+                page = page[:page_size]
+                results = [summarize_result(record) if summary else record for _, record in page]
+                next_cursor = None
+                if has_more:
+                    offset, last = page[-1]
+                    next_cursor = encode_cursor([last.get('completed_at'), last.get('_id'), offset])
+                return results, next_cursor
+        except Exception as e:
+            print(f"Error getting quiz history page: {e}")
+            return [], None
+    
+    def get_quiz_result(self, user_id, result_id):
+        """Get one full quiz result (answers and scores included) by its _id"""
+        self._flush_user_writes(user_id)
+        
+        if self.use_mongodb:
+            try:
+                result = self.db.quiz_results.find_one({'_id': ObjectId(result_id), 'user_id': user_id},
+                                                       quiz_projection(False))
+                if result:
+                    result['_id'] = str(result['_id'])
+                return result
+            except Exception as e:
+                print(f"Error getting quiz result: {e}")
+                return None
+        elif self.use_sqlite:
+            try:
+                row = self.sql.query_one(
+                    "SELECT * FROM quiz_results WHERE id = ? AND user_id = ?", (int(result_id), user_id)
+                )
+                if row is None:
+                    return None
+                result = decode_row('quiz_results', row)
+                result['_id'] = str(result.pop('id'))
+                return result
+            except Exception as e:
+                print(f"Error getting quiz result: {e}")
+                return None
+        else:
+            # JSON fallback: recent results are found first
+            try:
+                for _, record in self._log("quiz_results", user_id).reverse():
+                    if record.get('_id') == result_id:
+                        return record
+                return None
+            except Exception as e:
+                print(f"Error getting quiz result: {e}")
+                return None
+    
     def save_flashcard_progress(self, user_id, total_cards, known_cards, review_cards):
         """Save flashcard progress"""
         data = {
@@ -149,7 +882,15 @@ class Database:
             'review_cards': review_cards,
             'updated_at': datetime.now().isoformat()
         }
-        
+        saved = self._write_flashcard_progress(data)
+        # Only now: a read that raced the write must not cache the old progress
+        self.read_cache.invalidate(user_id)
+        return saved
+    
+    def _write_flashcard_progress(self, data):
+        """Upsert a progress snapshot and the user's known-card count"""
+        user_id = data['user_id']
+        known_cards = data['known_cards']
         if self.use_mongodb:
             try:
                 # Upsert (update or insert)
@@ -158,6 +899,24 @@ class Database:
                     {'$set': data},
                     upsert=True
                 )
+                self.db.user_stats.update_one(
+                    {'_id': user_id},
+                    {'$set': {'flashcards_known': len(known_cards), 'updated_at': data['updated_at']}},
+                    upsert=True
+                )
+                return True
+            except Exception as e:
+                print(f"Error saving flashcard progress: {e}")
+                return False
+        elif self.use_sqlite:
+            try:
+                with self.sql.transaction() as conn:
+                    self.sql.upsert(conn, 'flashcard_progress', data, 'user_id')
+                    self.sql.upsert(conn, 'user_stats', {
+                        'user_id': user_id,
+                        'flashcards_known': len(known_cards),
+                        'updated_at': data['updated_at']
+                    }, 'user_id')
                 return True
             except Exception as e:
                 print(f"Error saving flashcard progress: {e}")
@@ -165,16 +924,117 @@ class Database:
         else:
             # JSON fallback
             try:
-                file_path = os.path.join(self.data_dir, f"flashcards_{user_id}.json")
-                with open(file_path, 'w') as f:
-                    json.dump(data, f, indent=2)
+                # Latest snapshot wins; old snapshots are compacted away
+                log = self._log("flashcards", user_id)
+                log.append(data)
+                if log.line_count() > FLASHCARD_COMPACT_LINES:
+                    log.compact(keep_last=True)
+                self._update_json_summary(user_id, set_fields={'flashcards_known': len(known_cards)})
                 return True
             except Exception as e:
                 print(f"Error saving flashcard progress: {e}")
                 return False
     
     def get_user_stats(self, user_id):
-        """Get user statistics"""
+        """Get user statistics (cached until the user saves a result or progress)"""
+        return self.read_cache.get_or_load('user_stats', user_id, (),
+                                           lambda: self._read_user_stats(user_id))
+    
+    def _read_user_stats(self, user_id):
+        """Read statistics from the per-user summary record"""
+        self._flush_user_writes(user_id)
+        
+        try:
+            if self.use_mongodb:
+                summary = self.db.user_stats.find_one({'_id': user_id})
+            elif self.use_sqlite:
+                row = self.sql.query_one(
+                    "SELECT * FROM user_stats WHERE user_id = ?", (user_id,)
+                )
+                summary = dict(row) if row else None
+            else:
+                # JSON fallback
+                summary = self._read_json_summary(user_id)
+        except Exception as e:
+            print(f"Error getting user stats: {e}")
+            summary = None
+        
+        return stats_from_summary(summary or {})
+    
+    def get_daily_rollups(self, user_id, start_day=None, end_day=None):
+        """Per-day activity of a user between two dates (inclusive), oldest first.
+        
+        Only days with at least one quiz are returned, one small record each:
+        day, quizzes, questions_answered, score_sum and time_spent (seconds).
+        """
+        start_day = str(start_day) if start_day else "0000-00-00"
+        end_day = str(end_day) if end_day else "9999-99-99"
+        return self.read_cache.get_or_load('daily_rollups', user_id, (start_day, end_day),
+                                           lambda: self._read_daily_rollups(user_id, start_day, end_day))
+    
+    def _read_daily_rollups(self, user_id, start_day, end_day):
+        self._flush_user_writes(user_id)
+        
+        fields = ('day', 'quizzes', 'questions_answered', 'score_sum', 'time_spent')
+        try:
+            if self.use_mongodb:
+                return list(self.db.daily_rollups.find(
+                    {'user_id': user_id, 'day': {'$gte': start_day, '$lte': end_day}},
+                    {'_id': 0, **{field: 1 for field in fields}}
+                ).sort('day', 1))
+            elif self.use_sqlite:
+                rows = self.sql.query(
+                    f"SELECT {', '.join(fields)} FROM daily_rollups "
+                    "WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+                    (user_id, start_day, end_day)
+                )
+                return [dict(row) for row in rows]
+            else:
+                # JSON fallback
+                rollups = self._read_json_rollups(user_id)
+                return [{'day': day, **rollups[day]} for day in sorted(rollups) if start_day <= day <= end_day]
+        except Exception as e:
+            print(f"Error getting daily rollups: {e}")
+            return []
+    
+    def _compute_daily_rollups(self, user_id):
+        """Recompute a user's daily rollups from the raw quiz results"""
+        if self.use_mongodb:
+            rows = self.db.quiz_results.aggregate([
+                {'$match': {'user_id': user_id}},
+                {'$group': {
+                    '_id': {'$substr': ['$completed_at', 0, 10]},
+                    'quizzes': {'$sum': 1},
+                    'questions_answered': {'$sum': '$questions_count'},
+                    'score_sum': {'$sum': '$total_score'},
+                    'time_spent': {'$sum': {'$ifNull': ['$time_spent', 0]}}
+                }}
+            ])
+            return {row.pop('_id'): row for row in rows}
+        
+        if self.use_sqlite:
+            rows = self.sql.query(
+                "SELECT substr(completed_at, 1, 10) AS day, COUNT(*) AS quizzes, "
+                "SUM(questions_count) AS questions_answered, SUM(total_score) AS score_sum, "
+                "COALESCE(SUM(time_spent), 0) AS time_spent "
+                "FROM quiz_results WHERE user_id = ? GROUP BY day",
+                (user_id,)
+            )
+            return {row['day']: {k: row[k] for k in row.keys() if k != 'day'} for row in rows}
+        
+        rollups = {}
+        for result in self._log("quiz_results", user_id):
+            day = rollups.setdefault(result['completed_at'][:10], {
+                'quizzes': 0, 'questions_answered': 0, 'score_sum': 0, 'time_spent': 0
+            })
+            day['quizzes'] += 1
+            day['questions_answered'] += result['questions_count']
+            day['score_sum'] += result['total_score']
+            day['time_spent'] += result.get('time_spent') or 0
+        return rollups
+    
+    def _compute_user_stats(self, user_id):
+        """Recompute user statistics from the raw quiz and flashcard records"""
         stats = {
             'total_quizzes': 0,
             'average_score': 0,
@@ -184,17 +1044,51 @@ class Database:
         
         if self.use_mongodb:
             try:
-                # Quiz stats
-                quiz_results = list(self.db.quiz_results.find({'user_id': user_id}))
-                if quiz_results:
-                    stats['total_quizzes'] = len(quiz_results)
-                    stats['average_score'] = sum(r['total_score'] for r in quiz_results) / len(quiz_results)
-                    stats['total_questions_answered'] = sum(r['questions_count'] for r in quiz_results)
+                # Quiz stats, computed server-side
+                quiz_stats = list(self.db.quiz_results.aggregate([
+                    {'$match': {'user_id': user_id}},
+                    {'$project': {'_id': 0, 'total_score': 1, 'questions_count': 1}},
+                    {'$group': {
+                        '_id': None,
+                        'total_quizzes': {'$sum': 1},
+                        'average_score': {'$avg': '$total_score'},
+                        'total_questions_answered': {'$sum': '$questions_count'}
+                    }}
+                ]))
+                if quiz_stats:
+                    stats['total_quizzes'] = quiz_stats[0]['total_quizzes']
+                    stats['average_score'] = quiz_stats[0]['average_score'] or 0
+                    stats['total_questions_answered'] = quiz_stats[0]['total_questions_answered']
                 
-                # Flashcard stats
-                flashcard_data = self.db.flashcard_progress.find_one({'user_id': user_id})
-                if flashcard_data:
-                    stats['flashcards_known'] = len(flashcard_data.get('known_cards', []))
+                # Flashcard stats: only the size of the known list comes back
+                flashcard_stats = list(self.db.flashcard_progress.aggregate([
+                    {'$match': {'user_id': user_id}},
+                    {'$project': {'_id': 0, 'known': {'$size': {'$ifNull': ['$known_cards', []]}}}}
+                ]))
+                if flashcard_stats:
+                    stats['flashcards_known'] = flashcard_stats[0]['known']
+                
+                return stats
+            except Exception as e:
+                print(f"Error getting user stats: {e}")
+                return stats
+        elif self.use_sqlite:
+            try:
+                total_quizzes, average_score, questions_sum = self.sql.query_one(
+                    "SELECT COUNT(*), AVG(total_score), SUM(questions_count) FROM quiz_results WHERE user_id = ?",
+                    (user_id,)
+                )
+                if total_quizzes:
+                    stats['total_quizzes'] = total_quizzes
+                    stats['average_score'] = average_score
+                    stats['total_questions_answered'] = questions_sum
+                
+                row = self.sql.query_one(
+                    "SELECT json_array_length(known_cards) FROM flashcard_progress WHERE user_id = ?",
+                    (user_id,)
+                )
+                if row:
+                    stats['flashcards_known'] = row[0]
                 
                 return stats
             except Exception as e:
@@ -203,34 +1097,689 @@ class Database:
         else:
             # JSON fallback
             try:
-                # Quiz stats
-                quiz_file = os.path.join(self.data_dir, f"quiz_results_{user_id}.json")
-                if os.path.exists(quiz_file):
-                    with open(quiz_file, 'r') as f:
-                        quiz_results = json.load(f)
-                    if quiz_results:
-                        stats['total_quizzes'] = len(quiz_results)
-                        stats['average_score'] = sum(r['total_score'] for r in quiz_results) / len(quiz_results)
-                        stats['total_questions_answered'] = sum(r['questions_count'] for r in quiz_results)
+                # Quiz stats, one record in memory at a time
+                total_quizzes = 0
+                score_sum = 0
+                questions_sum = 0
+                for result in self._log("quiz_results", user_id):
+                    total_quizzes += 1
+                    score_sum += result['total_score']
+                    questions_sum += result['questions_count']
+                if total_quizzes:
+                    stats['total_quizzes'] = total_quizzes
+                    stats['average_score'] = score_sum / total_quizzes
+                    stats['total_questions_answered'] = questions_sum
                 
                 # Flashcard stats
-                flashcard_file = os.path.join(self.data_dir, f"flashcards_{user_id}.json")
-                if os.path.exists(flashcard_file):
-                    with open(flashcard_file, 'r') as f:
-                        flashcard_data = json.load(f)
+                flashcard_data = self._log("flashcards", user_id).last()
+                if flashcard_data:
                     stats['flashcards_known'] = len(flashcard_data.get('known_cards', []))
                 
                 return stats
             except Exception as e:
                 print(f"Error getting user stats: {e}")
                 return stats
+    
+    def _summary_file(self, user_id):
+        """Path of the JSON summary record for one user"""
+        return os.path.join(self.data_dir, f"user_stats_{user_id}.json")
+    
+    def _read_json_summary(self, user_id):
+        file_path = self._summary_file(user_id)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    
+    def _write_json_summary(self, user_id, summary):
+        file_path = self._summary_file(user_id)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(summary, f)
+        os.replace(tmp_path, file_path)
+    
+    def _update_json_summary(self, user_id, inc=None, set_fields=None):
+        """Read-modify-write of a JSON summary, the file equivalent of $inc / $set.
+        
+        Held under the file's lock, which other processes (CLI, maintenance,
+        a second app) take too, so no increment is overwritten.
+        """
+        with file_lock(self._summary_file(user_id)):
+            summary = self._read_json_summary(user_id) or {'user_id': user_id}
+            for field, value in (inc or {}).items():
+                summary[field] = summary.get(field, 0) + value
+            summary.update(set_fields or {})
+            summary['updated_at'] = datetime.now().isoformat()
+            self._write_json_summary(user_id, summary)
+    
+    def _rollup_file(self, user_id):
+        """Path of the JSON daily rollups (day -> record) for one user"""
+        return os.path.join(self.data_dir, f"daily_{user_id}.json")
+    
+    def _read_json_rollups(self, user_id):
+        file_path = self._rollup_file(user_id)
+        if not os.path.exists(file_path):
+            return {}
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    
+    def _write_json_rollups(self, user_id, rollups):
+        file_path = self._rollup_file(user_id)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(rollups, f)
+        os.replace(tmp_path, file_path)
+    
+    def _update_json_rollup(self, user_id, day, inc):
+        with file_lock(self._rollup_file(user_id)):
+            rollups = self._read_json_rollups(user_id)
+            record = rollups.setdefault(day, {})
+            for field, value in inc.items():
+                record[field] = record.get(field, 0) + value
+            self._write_json_rollups(user_id, rollups)
+    
+    def _list_users(self):
+        """Every user id with quiz results or flashcard progress"""
+        if self.use_mongodb:
+            return set(self.db.quiz_results.distinct('user_id')) | set(self.db.flashcard_progress.distinct('user_id'))
+        if self.use_sqlite:
+            rows = self.sql.query(
+                "SELECT user_id FROM quiz_results UNION SELECT user_id FROM flashcard_progress"
+            )
+            return {row[0] for row in rows}
+        
+        users = set()
+        for name in os.listdir(self.data_dir):
+            for prefix in ("quiz_results_", "flashcards_"):
+                if name.startswith(prefix) and name.endswith(".jsonl"):
+                    users.add(name[len(prefix):-len(".jsonl")])
+        return users
+    
+    def rebuild_user_summaries(self, user_ids=None):
+        """Repair job: recompute summary records and daily rollups from the raw data.
+        
+        Rebuilds the given users (default: everyone) and returns how many
+        users were rebuilt.
+        """
+        if self.quiz_writes is not None:
+            self.quiz_writes.flush()
+        
+        rebuilt = 0
+        for user_id in (user_ids if user_ids is not None else self._list_users()):
+            try:
+                stats = self._compute_user_stats(user_id)
+                summary = {
+                    'total_quizzes': stats['total_quizzes'],
+                    'score_sum': stats['average_score'] * stats['total_quizzes'],
+                    'total_questions_answered': stats['total_questions_answered'],
+                    'flashcards_known': stats['flashcards_known'],
+                    'updated_at': datetime.now().isoformat()
+                }
+                rollups = self._compute_daily_rollups(user_id)
+                
+                if self.use_mongodb:
+                    self.db.user_stats.replace_one({'_id': user_id}, summary, upsert=True)
+                    self.db.daily_rollups.delete_many({'user_id': user_id})
+                    if rollups:
+                        self.db.daily_rollups.insert_many([
+                            {'user_id': user_id, 'day': day, **record, 'updated_at': summary['updated_at']}
+                            for day, record in rollups.items()
+                        ])
+                elif self.use_sqlite:
+                    with self.sql.transaction() as conn:
+                        self.sql.upsert(conn, 'user_stats', {'user_id': user_id, **summary}, 'user_id')
+                        conn.execute("DELETE FROM daily_rollups WHERE user_id = ?", (user_id,))
+                        for day, record in rollups.items():
+                            self.sql.insert(conn, 'daily_rollups', {
+                                'user_id': user_id, 'day': day, **record, 'updated_at': summary['updated_at']
+                            })
+                else:
+                    with file_lock(self._summary_file(user_id)), file_lock(self._rollup_file(user_id)):
+                        self._write_json_summary(user_id, {'user_id': user_id, **summary})
+                        self._write_json_rollups(user_id, rollups)
+                self.read_cache.invalidate(user_id)
+                rebuilt += 1
+            except Exception as e:
+                print(f"Error rebuilding stats summary for {user_id}: {e}")
+        return rebuilt
+    
+    def _ensure_user_summaries(self):
+        """Build summaries and rollups for existing data the first time the store is used"""
+        try:
+            if self.use_mongodb:
+                missing = (self.db.user_stats.estimated_document_count() == 0
+                           or (self.db.daily_rollups.estimated_document_count() == 0
+                               and self.db.quiz_results.estimated_document_count() > 0))
+            elif self.use_sqlite:
+                with self.sql.connection() as conn:
+                    missing = (conn.execute("SELECT 1 FROM user_stats LIMIT 1").fetchone() is None
+                               or (conn.execute("SELECT 1 FROM daily_rollups LIMIT 1").fetchone() is None
+                                   and conn.execute("SELECT 1 FROM quiz_results LIMIT 1").fetchone() is not None))
+            else:
+                names = os.listdir(self.data_dir)
+                missing = (not any(name.startswith("user_stats_") for name in names)
+                           or (not any(name.startswith("daily_") for name in names)
+                               and any(name.startswith("quiz_results_") for name in names)))
+            
+            if missing:
+                rebuilt = self.rebuild_user_summaries()
+                if rebuilt:
+                    print(f"Built stats summaries for {rebuilt} users")
+        except Exception as e:
+            print(f"Error building stats summaries: {e}")
+    
+    def _iter_user_records(self, user_id):
+        """Yield (type, record) for everything a user owns, streamed from cursors"""
+        if self.use_mongodb:
+            for record in self.db.quiz_results.find({'user_id': user_id}, {'summary_state': 0}).sort('completed_at', 1).batch_size(IMPORT_CHUNK_SIZE):
+                # Results saved before result_id existed are known by their ObjectId
+                object_id = record.pop('_id')
+                record['result_id'] = record.get('result_id') or str(object_id)
+                yield 'quiz_result', record
+            progress = self.db.flashcard_progress.find_one({'user_id': user_id}, {'_id': 0})
+            if progress:
+                yield 'flashcard_progress', progress
+            for record in self.db.question_bank.find({'user_id': user_id}, {'_id': 0}).batch_size(IMPORT_CHUNK_SIZE):
+                yield 'question', record
+        
+        elif self.use_sqlite:
+            with self.sql.connection() as conn:
+                for row in conn.execute("SELECT * FROM quiz_results WHERE user_id = ? ORDER BY completed_at", (user_id,)):
+                    record = decode_row('quiz_results', row)
+                    record.pop('id')
+                    yield 'quiz_result', record
+                row = conn.execute("SELECT * FROM flashcard_progress WHERE user_id = ?", (user_id,)).fetchone()
+                if row:
+                    yield 'flashcard_progress', decode_row('flashcard_progress', row)
+                for row in conn.execute("SELECT * FROM question_bank WHERE user_id = ?", (user_id,)):
+                    record = decode_row('question_bank', row)
+                    record.pop('id')
+                    yield 'question', record
+        
+        else:
+            # JSON fallback
+            for record in self._log("quiz_results", user_id):
+                yield 'quiz_result', result_from_json(record)
+            progress = self._log("flashcards", user_id).last()
+            if progress:
+                yield 'flashcard_progress', progress
+            bank_dir = os.path.join(self.data_dir, "question_bank")
+            if os.path.isdir(bank_dir):
+                for name in sorted(os.listdir(bank_dir)):
+                    if name.endswith(".jsonl"):
+                        for record in JsonlLog(os.path.join(bank_dir, name)):
+                            if record.get('user_id') == user_id:
+                                yield 'question', record
+    
+    def export_user_data(self, user_id, path):
+        """Stream a user's quiz results, flashcard progress and banked questions to NDJSON.
+        
+        One ``{"type": ..., "data": ...}`` object per line (gzip if the path
+        ends in .gz), written as the records come off the cursor so memory
+        use stays flat. Returns the number of records written per type.
+        """
+        self._flush_user_writes(user_id)
+        
+        counts = {record_type: 0 for record_type in IMPORT_KEYS}
+        try:
+            with open_ndjson(path, 'w') as f:
+                header = {'type': 'export', 'data': {'user_id': user_id, 'backend': self.backend,
+                                                      'exported_at': datetime.now().isoformat()}}
+                f.write(json.dumps(header) + "\n")
+                for record_type, record in self._iter_user_records(user_id):
+                    f.write(json.dumps({'type': record_type, 'data': record}, separators=(',', ':')) + "\n")
+                    counts[record_type] += 1
+        except Exception as e:
+            print(f"Error exporting data for {user_id}: {e}")
+        return counts
+    
+    def import_user_data(self, path, user_id=None):
+        """Stream an NDJSON export back in, in chunks of IMPORT_CHUNK_SIZE.
+        
+        Every record is upserted on its key (the result_id of quiz results,
+        otherwise the natural key in IMPORT_KEYS), so running the same import
+        twice, or importing overlapping exports, adds nothing twice. Pass
+        user_id to import the data under a different user.
+        Returns the number of records processed per type.
+        """
+        counts = {record_type: 0 for record_type in IMPORT_KEYS}
+        users = set()
+        chunks = {record_type: [] for record_type in IMPORT_KEYS}
+        
+        try:
+            with open_ndjson(path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    item = json.loads(line)
+                    record_type, record = item.get('type'), item.get('data')
+                    if record_type not in chunks:
+                        continue
+                    
+                    if user_id is not None:
+                        record['user_id'] = user_id
+                    users.add(record['user_id'])
+                    chunks[record_type].append(record)
+                    if len(chunks[record_type]) >= IMPORT_CHUNK_SIZE:
+                        self._import_chunk(record_type, chunks[record_type])
+                        counts[record_type] += len(chunks[record_type])
+                        chunks[record_type] = []
+            
+            for record_type, records in chunks.items():
+                if records:
+                    self._import_chunk(record_type, records)
+                    counts[record_type] += len(records)
+        except Exception as e:
+            print(f"Error importing {path}: {e}")
+        
+        # Summaries and rollups are derived data; recompute them for the imported users
+        self.rebuild_user_summaries(sorted(users))
+        return counts
+    
+    def _import_chunk(self, record_type, records):
+        """Idempotently write one chunk of imported records of one type"""
+        if self.use_mongodb:
+            self._upsert_mongodb(record_type, records)
+        
+        elif self.use_sqlite:
+            table = {'quiz_result': 'quiz_results',
+                     'flashcard_progress': 'flashcard_progress',
+                     'question': 'question_bank'}[record_type]
+            with self.sql.transaction() as conn:
+                for record in records:
+                    if record_type == 'flashcard_progress':
+                        self.sql.upsert(conn, table, record, 'user_id')
+                        continue
+                    keys = import_key(record_type, record)
+                    if record_type == 'quiz_result':
+                        record.setdefault('result_id', uuid.uuid4().hex)
+                    self.sql.insert_missing(conn, table, record, keys)
+        
+        else:
+            # JSON fallback: check keys against each target log's on-disk key index
+            by_log = {}
+            for record in records:
+                if record_type == 'quiz_result':
+                    log = self._log("quiz_results", record['user_id'])
+                elif record_type == 'flashcard_progress':
+                    log = self._log("flashcards", record['user_id'])
+                else:
+                    log = JsonlLog(self._question_bank_file(record['question_type'], record['content_hash']))
+                by_log.setdefault(log.path, (log, []))[1].append(record)
+            
+            for log, log_records in by_log.values():
+                if record_type == 'flashcard_progress':
+                    log.append(log_records[-1])
+                    continue
+                
+                # Quiz results keep their result_id as _id in the JSON logs
+                by_key = {}
+                for record in log_records:
+                    if record_type == 'quiz_result' and record.get('result_id'):
+                        record['_id'] = record['result_id']
+                        by_key.setdefault((('user_id', '_id'), 'ids'), []).append(record)
+                    else:
+                        by_key.setdefault((IMPORT_KEYS[record_type], 'keys'), []).append(record)
+                
+                new_records = []
+                for (keys, name), key_records in by_key.items():
+                    with KeyIndex(log, keys, name) as index:
+                        seen = set()  # duplicates within this chunk
+                        for record in key_records:
+                            key = index.key(record)
+                            if key not in seen and record not in index:
+                                seen.add(key)
+                                new_records.append(record)
+                if record_type == 'quiz_result':
+                    for record in new_records:
+                        record.setdefault('_id', uuid.uuid4().hex)
+                        record.setdefault('result_id', record['_id'])
+                # The indexes pick these up from the log the next time they are opened
+                log.append_many(new_records)
+        
+        for user in {record['user_id'] for record in records}:
+            self.read_cache.invalidate(user)
+    
+    def _upsert_mongodb(self, record_type, records):
+        """Unordered bulk upserts on each record's key (safe to repeat)"""
+        if record_type == 'generation_job':
+            collection = self.db.generation_jobs
+        else:
+            collection = {'quiz_result': self.db.quiz_results,
+                          'flashcard_progress': self.db.flashcard_progress,
+                          'question': self.db.question_bank}[record_type]
+        # Latest snapshot wins; results and questions are only ever inserted once
+        operator = '$setOnInsert' if record_type in ('quiz_result', 'question') else '$set'
+        
+        operations = []
+        for record in records:
+            keys = ('job_id',) if record_type == 'generation_job' else import_key(record_type, record)
+            query = {key: record.get(key) for key in keys}
+            if record_type == 'quiz_result':
+                result_id = record.setdefault('result_id', uuid.uuid4().hex)
+                if 'result_id' in query and ObjectId.is_valid(result_id):
+                    # Exported before results had a result_id: it is the ObjectId here
+                    query = {'user_id': query['user_id'],
+                             '$or': [{'result_id': result_id}, {'_id': ObjectId(result_id)}]}
+            operations.append(UpdateOne(query, {operator: record}, upsert=True))
+        collection.bulk_write(operations, ordered=False)
+    
+    def _job_file(self, job_id):
+        """Path of the JSON record for one generation job"""
+        jobs_dir = os.path.join(self.data_dir, "jobs")
+        os.makedirs(jobs_dir, exist_ok=True)
+        return os.path.join(jobs_dir, f"job_{job_id}.json")
+    
+    def create_generation_job(self, user_id, content, question_type, num_questions, topic=None):
+        """Record a queued background generation job and return its id"""
+        now = datetime.now().isoformat()
+        data = {
+            'job_id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'content': content,
+            'question_type': question_type,
+            'num_questions': num_questions,
+            'topic': topic,
+            'status': 'queued',
+            'questions': [],
+            'error': None,
+            'created_at': now,
+            'updated_at': now
+        }
+        
+        if self.use_mongodb:
+            try:
+                self.db.generation_jobs.insert_one(dict(data))
+                return data['job_id']
+            except Exception as e:
+                print(f"Error creating generation job: {e}")
+                return None
+        elif self.use_sqlite:
+            try:
+                with self.sql.transaction() as conn:
+                    self.sql.insert(conn, 'generation_jobs', data)
+                return data['job_id']
+            except Exception as e:
+                print(f"Error creating generation job: {e}")
+                return None
+        else:
+            # JSON fallback
+            try:
+                with open(self._job_file(data['job_id']), 'w') as f:
+                    json.dump(data, f)
+                return data['job_id']
+            except Exception as e:
+                print(f"Error creating generation job: {e}")
+                return None
+    
+    def update_generation_job(self, job_id, **fields):
+        """Update status, result or error of a generation job"""
+        fields['updated_at'] = datetime.now().isoformat()
+        
+        if self.use_mongodb:
+            try:
+                self.db.generation_jobs.update_one({'job_id': job_id}, {'$set': fields})
+                return True
+            except Exception as e:
+                print(f"Error updating generation job: {e}")
+                return False
+        elif self.use_sqlite:
+            try:
+                row = encode_row('generation_jobs', fields)
+                assignments = ", ".join(f"{column} = ?" for column in row)
+                with self.sql.transaction() as conn:
+                    conn.execute(f"UPDATE generation_jobs SET {assignments} WHERE job_id = ?",
+                                 (*row.values(), job_id))
+                return True
+            except Exception as e:
+                print(f"Error updating generation job: {e}")
+                return False
+        else:
+            # JSON fallback
+            try:
+                file_path = self._job_file(job_id)
+                with open(file_path, 'r') as f:
+                    data = json.load(f)
+                data.update(fields)
+                tmp_path = f"{file_path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, file_path)
+                return True
+            except Exception as e:
+                print(f"Error updating generation job: {e}")
+                return False
+    
+    def get_generation_job(self, job_id):
+        """Get a generation job by id"""
+        if self.use_mongodb:
+            try:
+                return self.db.generation_jobs.find_one({'job_id': job_id}, {'_id': 0})
+            except Exception as e:
+                print(f"Error getting generation job: {e}")
+                return None
+        elif self.use_sqlite:
+            try:
+                row = self.sql.query_one(
+                    "SELECT * FROM generation_jobs WHERE job_id = ?", (job_id,)
+                )
+                return decode_row('generation_jobs', row) if row else None
+            except Exception as e:
+                print(f"Error getting generation job: {e}")
+                return None
+        else:
+            # JSON fallback
+            try:
+                file_path = self._job_file(job_id)
+                if os.path.exists(file_path):
+                    with open(file_path, 'r') as f:
+                        return json.load(f)
+                return None
+            except Exception as e:
+                print(f"Error getting generation job: {e}")
+                return None
+    
+    def get_user_jobs(self, user_id, limit=10):
+        """Get the most recent generation jobs for a user (without content)"""
+        if self.use_mongodb:
+            try:
+                return list(self.db.generation_jobs.find(
+                    {'user_id': user_id},
+                    {'_id': 0, 'content': 0}
+                ).sort('created_at', -1).limit(limit))
+            except Exception as e:
+                print(f"Error getting generation jobs: {e}")
+                return []
+        elif self.use_sqlite:
+            try:
+                rows = self.sql.query(
+                    "SELECT job_id, user_id, question_type, num_questions, topic, status, questions, error, "
+                    "created_at, updated_at FROM generation_jobs WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+                    (user_id, limit)
+                )
+                return [decode_row('generation_jobs', row) for row in rows]
+            except Exception as e:
+                print(f"Error getting generation jobs: {e}")
+                return []
+        else:
+            # JSON fallback
+            try:
+                jobs = [job for job in self._iter_job_files() if job.get('user_id') == user_id]
+                jobs.sort(key=lambda job: job['created_at'], reverse=True)
+                for job in jobs:
+                    job.pop('content', None)
+                return jobs[:limit]
+            except Exception as e:
+                print(f"Error getting generation jobs: {e}")
+                return []
+    
+    def get_unfinished_jobs(self):
+        """Get jobs that were queued or running, e.g. before a restart"""
+        if self.use_mongodb:
+            try:
+                return list(self.db.generation_jobs.find(
+                    {'status': {'$in': ['queued', 'running']}},
+                    {'_id': 0}
+                ).sort('created_at', 1))
+            except Exception as e:
+                print(f"Error getting unfinished jobs: {e}")
+                return []
+        elif self.use_sqlite:
+            try:
+                rows = self.sql.query(
+                    "SELECT * FROM generation_jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+                )
+                return [decode_row('generation_jobs', row) for row in rows]
+            except Exception as e:
+                print(f"Error getting unfinished jobs: {e}")
+                return []
+        else:
+            # JSON fallback
+            try:
+                jobs = [job for job in self._iter_job_files() if job.get('status') in ('queued', 'running')]
+                jobs.sort(key=lambda job: job['created_at'])
+                return jobs
+            except Exception as e:
+                print(f"Error getting unfinished jobs: {e}")
+                return []
+    
+    def _iter_job_files(self):
+        """Yield every job record stored as JSON"""
+        jobs_dir = os.path.join(self.data_dir, "jobs")
+        if not os.path.isdir(jobs_dir):
+            return
+        for name in os.listdir(jobs_dir):
+            if name.startswith("job_") and name.endswith(".json"):
+                with open(os.path.join(jobs_dir, name), 'r') as f:
+                    yield json.load(f)
+
+def stats_from_summary(summary):
+    """Dashboard statistics from a per-user summary record"""
+    total_quizzes = summary.get('total_quizzes', 0)
+    return {
+        'total_quizzes': total_quizzes,
+        'average_score': summary.get('score_sum', 0) / total_quizzes if total_quizzes else 0,
+        'total_questions_answered': summary.get('total_questions_answered', 0),
+        'flashcards_known': summary.get('flashcards_known', 0)
+    }
+
+def summary_increments(records):
+    """Per-user stats and per-(user, day) rollup increments for a batch of quiz results"""
+    increments = {}
+    daily = {}
+    for record in records:
+        inc = increments.setdefault(record['user_id'], {
+            'total_quizzes': 0, 'score_sum': 0, 'total_questions_answered': 0
+        })
+        inc['total_quizzes'] += 1
+        inc['score_sum'] += record['total_score']
+        inc['total_questions_answered'] += record['questions_count']
+        
+        day_inc = daily.setdefault((record['user_id'], record['completed_at'][:10]), {
+            'quizzes': 0, 'questions_answered': 0, 'score_sum': 0, 'time_spent': 0
+        })
+        day_inc['quizzes'] += 1
+        day_inc['questions_answered'] += record['questions_count']
+        day_inc['score_sum'] += record['total_score']
+        day_inc['time_spent'] += record.get('time_spent') or 0
+    return increments, daily
+
+def import_key(record_type, record):
+    """Fields an imported or synced record is matched on"""
+    if record_type == 'quiz_result' and record.get('result_id'):
+        return RESULT_ID_KEY
+    return IMPORT_KEYS[record_type]
+
+def result_from_json(record):
+    """A quiz result from a JSON log, with its _id carried over as result_id"""
+    json_id = record.pop('_id', None)
+    if json_id and not record.get('result_id'):
+        record['result_id'] = json_id
+    return record
+
+def quiz_projection(summary):
+    """MongoDB projection for full or summary quiz results"""
+    return {field: 1 for field in QUIZ_SUMMARY_FIELDS} if summary else {'summary_state': 0}
+
+def quiz_columns(summary):
+    """SQLite column list for full or summary quiz results"""
+    return "id, " + ", ".join(QUIZ_SUMMARY_FIELDS) if summary else "*"
+
+def summarize_result(result):
+    """Listing fields of a quiz result read from JSON"""
+    summary = {field: result.get(field) for field in QUIZ_SUMMARY_FIELDS}
+    if '_id' in result:
+        summary['_id'] = result['_id']
+    return summary
+
+def open_ndjson(path, mode):
+    """Text file handle for NDJSON, gzip-compressed if the path ends in .gz"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def encode_cursor(values):
+    """Opaque pagination cursor from the sort key of the last item of a page"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    if not isinstance(values, list) or len(values) < 2:
+        raise ValueError("invalid pagination cursor")
+    return values
+
+def question_text(question):
+    """The text that identifies a generated question of any type"""
+    return question.get('question') or question.get('statement') or json.dumps(question, sort_keys=True)
 
 # Global database instance
 _db = None
+_db_lock = threading.Lock()
 
 def get_database():
-    """Get database instance (singleton)"""
+    """Get database instance (singleton).
+
+    Each instance starts its own writer and health-check threads, so two
+    must never be created, even by threads racing on first use.
+    """
     global _db
     if _db is None:
-        _db = Database()
-    return _db
\ No newline at end of file
+        with _db_lock:
+            if _db is None:
+                _db = Database()
+    return _db
+
+
+if __name__ == "__main__":
+    # python -m modules.database                       : ensure indexes, print query plans, repair summaries,
+    #                                                    compact JSON Lines files (schedule it, e.g. nightly)
+    # python -m modules.database compact               : only compact the JSON Lines files
+    # python -m modules.database export USER FILE      : stream a user's data to NDJSON (.gz to compress)
+    # python -m modules.database import FILE [--user-id USER]
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Database maintenance and NDJSON export / import")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("compact", help="Compact the JSON Lines files of the JSON fallback")
+    export_parser = commands.add_parser("export", help="Export one user's data")
+    export_parser.add_argument("user_id")
+    export_parser.add_argument("path")
+    import_parser = commands.add_parser("import", help="Import an NDJSON export")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--user-id", help="Import the records under this user instead")
+    args = parser.parse_args()
+    
+    database = get_database()
+    database.wait_for_mongodb(timeout=30)
+    if args.command == "export":
+        print(f"Exported {database.export_user_data(args.user_id, args.path)}")
+    elif args.command == "import":
+        print(f"Imported {database.import_user_data(args.path, user_id=args.user_id)}")
+    elif args.command == "compact":
+        print(f"Compacted {database.compact_json_storage()} JSON Lines files")
+    else:
+        database.ensure_indexes()
+        database.explain_queries()
+        print(f"Rebuilt {database.rebuild_user_summaries()} stats summaries")
+        print(f"Compacted {database.compact_json_storage()} JSON Lines files")
@@ -0,0 +1,20 @@
+# modules/document_loader.py
+import PyPDF2
+
+
+def extract_text(uploaded_file, file_type=None):
+    """Extract plain text from an uploaded PDF or text file"""
+    if file_type is None:
+        file_type = getattr(uploaded_file, 'type', '')
+
+    if file_type == "application/pdf":
+        pdf_reader = PyPDF2.PdfReader(uploaded_file)
+        text = ""
+        for page in pdf_reader.pages:
+            text += page.extract_text() or ""
+        return text
+
+    data = uploaded_file.read()
+    if isinstance(data, bytes):
+        data = data.decode('utf-8', errors='replace')
+    return data
@@ -0,0 +1,67 @@
+# modules/embeddings.py
+import threading
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# Use the same sentence model as the answer evaluator when it is installed
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+EMBEDDING_DIM = 384
+
+
+class TextEmbedder:
+    def __init__(self):
+        """Initialize the text embedder"""
+        if SENTENCE_TRANSFORMERS_AVAILABLE:
+            self.model_name = 'all-MiniLM-L6-v2'
+            self.model = SentenceTransformer(self.model_name)
+        else:
+            # Stateless fallback: identical text always maps to the same vector
+            self.model_name = f'hashing-{EMBEDDING_DIM}'
+            self.model = HashingVectorizer(
+                n_features=EMBEDDING_DIM,
+                alternate_sign=False,
+                ngram_range=(1, 2),
+                norm='l2'
+            )
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        """Embed a list of texts as L2-normalized rows"""
+        if not texts:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+        with self._lock:
+            if SENTENCE_TRANSFORMERS_AVAILABLE:
+                vectors = self.model.encode(list(texts), normalize_embeddings=True)
+            else:
+                vectors = self.model.transform(list(texts)).toarray()
+        return np.asarray(vectors, dtype=np.float32)
+
+    def embed_one(self, text):
+        """Embed a single text"""
+        return self.embed([text])[0]
+
+
+def cosine_similarities(vector, matrix):
+    """Cosine similarity of one normalized vector against normalized rows"""
+    if matrix is None or len(matrix) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.asarray(matrix, dtype=np.float32) @ np.asarray(vector, dtype=np.float32)
+
+
+# Global embedder instance
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder():
+    """Get text embedder instance (singleton)"""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = TextEmbedder()
+    return _embedder
@@ -0,0 +1,103 @@
+# modules/hedging.py
+import threading
+from concurrent.futures import Future, wait, as_completed, FIRST_COMPLETED
+
+
+class HedgeCancelled(Exception):
+    """Raised inside a request that lost the race to its hedge"""
+
+
+class HedgeBudget:
+    """Token bucket that caps hedges to a fraction of all requests"""
+
+    def __init__(self, ratio=0.1, burst=5):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = float(burst)
+        self._lock = threading.Lock()
+
+    def on_request(self):
+        """Every primary request earns a fraction of a hedge"""
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self):
+        """Take one hedge from the budget, if there is one"""
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+def _start(fn, event):
+    """Run ``fn(event)`` on its own daemon thread and return its Future.
+
+    A request stuck before its first byte cannot be interrupted, so losers
+    get their own thread instead of holding a worker of a shared pool until
+    their read timeout fires.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(event))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="hedge", daemon=True).start()
+    return future
+
+
+def hedged_call(primary, backup, delay, budget):
+    """Run ``primary``; if it has not finished after ``delay`` seconds and the
+    budget allows, also run ``backup``. The first call to return wins and the
+    other is asked to stop.
+
+    Both callables take a ``threading.Event`` that is set when they should
+    give up. Returns ``(result, hedged, winner)`` where winner is
+    'primary' or 'backup'.
+    """
+    budget.on_request()
+
+    events = {'primary': threading.Event()}
+    futures = {_start(primary, events['primary']): 'primary'}
+
+    done, _ = wait(list(futures), timeout=delay, return_when=FIRST_COMPLETED)
+    hedged = False
+    if not done and budget.try_spend():
+        events['backup'] = threading.Event()
+        futures[_start(backup, events['backup'])] = 'backup'
+        hedged = True
+
+    error = None
+    for future in as_completed(list(futures)):
+        name = futures[future]
+        try:
+            result = future.result()
+        except Exception as e:
+            if error is None or isinstance(error, HedgeCancelled):
+                error = e
+            continue
+
+        # Ask the loser to stop; it leaves its stream at the next chunk or read timeout
+        for other, other_name in futures.items():
+            if other is not future:
+                events[other_name].set()
+        return result, hedged, name
+
+    raise error
+
+
+_hedge_budget = None
+_hedge_budget_lock = threading.Lock()
+
+def get_hedge_budget(ratio=0.1):
+    """Get the process-wide hedge budget, so every generator shares one limit"""
+    global _hedge_budget
+    with _hedge_budget_lock:
+        if _hedge_budget is None:
+            _hedge_budget = HedgeBudget(ratio=ratio)
+        return _hedge_budget
@@ -0,0 +1,100 @@
+# modules/job_queue.py
+import threading
+
+from modules.database import get_database
+from modules.scheduler import get_scheduler, content_cost, QuotaExceeded
+
+
+class GenerationJobQueue:
+    """Runs question generation in the background.
+
+    Jobs are persisted through the Database layer so the UI can poll their
+    status and unfinished jobs are picked up again after a restart. The
+    work itself is dispatched through the fair GenerationScheduler.
+    """
+
+    def __init__(self, generator, database, scheduler):
+        self.generator = generator
+        self.database = database
+        self.scheduler = scheduler
+        self._resume_unfinished()
+
+    def _resume_unfinished(self):
+        """Re-submit jobs that never finished in a previous process"""
+        for job in self.database.get_unfinished_jobs():
+            self.database.update_generation_job(job['job_id'], status='queued')
+            try:
+                self._submit(job['job_id'], job['user_id'], job['content'])
+            except QuotaExceeded:
+                pass
+
+    def _submit(self, job_id, user_id, content):
+        """Hand a job to the scheduler, failing the job if over quota"""
+        try:
+            self.scheduler.submit(user_id, self._run, (job_id,), cost=content_cost(content))
+        except QuotaExceeded as e:
+            self.database.update_generation_job(job_id, status='failed', error=str(e))
+            raise
+
+    def enqueue(self, user_id, content, question_type, num_questions=5, topic=None):
+        """Queue a generation job and return its id.
+
+        Raises QuotaExceeded when the user is over their generation quota.
+        """
+        job_id = self.database.create_generation_job(
+            user_id, content, question_type, num_questions, topic
+        )
+        if job_id:
+            self._submit(job_id, user_id, content)
+        return job_id
+
+    def _run(self, job_id):
+        """Worker: generate questions for one job and store the result"""
+        job = self.database.get_generation_job(job_id)
+        if job is None:
+            return
+
+        self.database.update_generation_job(job_id, status='running')
+        try:
+            questions = self.generator.generate(
+                job['content'],
+                job['question_type'],
+                job['num_questions'],
+                topic=job.get('topic'),
+                user_id=job['user_id']
+            )
+            if questions:
+                self.database.update_generation_job(job_id, status='done', questions=questions)
+            else:
+                self.database.update_generation_job(job_id, status='failed', error='No questions generated')
+        except Exception as e:
+            print(f"Error running generation job {job_id}: {e}")
+            self.database.update_generation_job(job_id, status='failed', error=str(e))
+
+    def status(self, job_id):
+        """Get the current record of a job"""
+        return self.database.get_generation_job(job_id)
+
+    def user_jobs(self, user_id, limit=10):
+        """Get the most recent jobs of a user"""
+        return self.database.get_user_jobs(user_id, limit)
+
+
+# Global job queue instance
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Get job queue instance (singleton)"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            from modules.question_generator import QuestionGenerator
+
+            database = get_database()
+            _job_queue = GenerationJobQueue(
+                QuestionGenerator(database=database),
+                database,
+                get_scheduler()
+            )
+    return _job_queue
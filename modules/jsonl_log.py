@@ -0,0 +1,339 @@
+# modules/jsonl_log.py
+import os
+import dbm
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Cross-process file locking where the platform has it
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 'always' fsyncs every append, 'interval' at most every FSYNC_INTERVAL
+# seconds per file, 'never' leaves flushing to the OS
+FSYNC_MODE = os.getenv("JSONL_FSYNC", "interval")
+FSYNC_INTERVAL = float(os.getenv("JSONL_FSYNC_INTERVAL", "1.0"))
+
+_locks = {}
+_last_fsync = {}
+_locks_guard = threading.Lock()
+
+
+def _thread_lock(path):
+    with _locks_guard:
+        if path not in _locks:
+            _locks[path] = threading.Lock()
+        return _locks[path]
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on ``path`` across threads and (where fcntl exists) processes.
+
+    The lock is taken on a ``<path>.lock`` sidecar, so the file itself can
+    be replaced while it is held.
+    """
+    with _thread_lock(path):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def iter_json_array(file_path, chunk_size=65536):
+    """Yield the elements of a JSON array file without loading the whole file"""
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r') as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{file_path} does not contain a JSON array")
+        buffer = buffer[1:]
+
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+                if end == len(buffer):
+                    # A value ending exactly at the buffer edge may be cut short
+                    raise ValueError("incomplete")
+            except ValueError:
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buffer += more
+                continue
+            yield item
+            buffer = buffer[end:]
+            if len(buffer) < chunk_size:
+                buffer += f.read(chunk_size)
+
+
+class JsonlLog:
+    """Append-only JSON Lines file.
+
+    Each append is a single ``write`` on an O_APPEND descriptor under a
+    per-file lock, so concurrent writers never overwrite each other.
+    Unparseable lines (e.g. a write torn by a crash) are skipped on read
+    and dropped on compaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _locked(self):
+        return file_lock(self.path)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _needs_newline(self, fd):
+        """True if a previous writer died mid-line"""
+        size = os.fstat(fd).st_size
+        if size == 0:
+            return False
+        return os.pread(fd, 1, size - 1) != b"\n"
+
+    def append_many(self, records):
+        """Append records as one write"""
+        if not records:
+            return
+        payload = "".join(json.dumps(r, separators=(',', ':')) + "\n" for r in records).encode('utf-8')
+
+        with self._locked():
+            fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if self._needs_newline(fd):
+                    payload = b"\n" + payload
+                os.write(fd, payload)
+                now = time.monotonic()
+                due = now - _last_fsync.get(self.path, 0.0) >= FSYNC_INTERVAL
+                if FSYNC_MODE == 'always' or (FSYNC_MODE == 'interval' and due):
+                    os.fsync(fd)
+                    _last_fsync[self.path] = now
+            finally:
+                os.close(fd)
+
+    def append(self, record):
+        """Append one record"""
+        self.append_many([record])
+
+    def __iter__(self):
+        """Yield every valid record, oldest first"""
+        if not self.exists():
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                record = self._parse(line)
+                if record is not None:
+                    yield record
+
+    def reverse(self, end=None, block_size=8192):
+        """Yield ``(offset, record)`` for valid records, newest first.
+
+        Reads fixed-size blocks backwards from ``end`` (default: end of file),
+        so the cost depends on how many records are consumed, not on the file
+        length. ``offset`` is where the record's line starts and can be passed
+        back as ``end`` to continue with the records before it.
+        """
+        if not self.exists():
+            return
+
+        with open(self.path, 'rb') as f:
+            position = f.seek(0, os.SEEK_END) if end is None else end
+            remainder = b""
+            while position > 0:
+                read_size = min(block_size, position)
+                position -= read_size
+                f.seek(position)
+                lines = (f.read(read_size) + remainder).split(b"\n")
+
+                starts = []
+                offset = position
+                for line in lines:
+                    starts.append(offset)
+                    offset += len(line) + 1
+
+                # The first piece may be the end of a line that starts in an earlier block
+                remainder = b""
+                if position > 0:
+                    remainder = lines.pop(0)
+                    starts.pop(0)
+
+                for start, line in zip(reversed(starts), reversed(lines)):
+                    record = self._parse(line)
+                    if record is not None:
+                        yield start, record
+
+    def tail(self, limit, block_size=8192):
+        """The last ``limit`` valid records, newest first"""
+        records = []
+        if limit <= 0:
+            return records
+        for _, record in self.reverse(block_size=block_size):
+            records.append(record)
+            if len(records) >= limit:
+                break
+        return records
+
+    def read_at(self, offset):
+        """The record whose line starts at ``offset``, or None"""
+        if not self.exists():
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return self._parse(f.readline())
+
+    @staticmethod
+    def _parse(line):
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    def last(self):
+        """The most recently appended valid record, or None"""
+        records = self.tail(1)
+        return records[0] if records else None
+
+    def line_count(self):
+        if not self.exists():
+            return 0
+        with open(self.path, 'rb') as f:
+            return sum(1 for _ in f)
+
+    def compact(self, keep_last=False):
+        """Rewrite the file without invalid lines (and only the latest record if keep_last)"""
+        with self._locked():
+            if not self.exists():
+                return 0
+            records = [self.last()] if keep_last else list(self)
+            records = [r for r in records if r is not None]
+
+            tmp_path = f"{self.path}.compact"
+            with open(tmp_path, 'w') as f:
+                for record in records:
+                    f.write(json.dumps(record, separators=(',', ':')) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return len(records)
+
+
+class KeyIndex:
+    """On-disk set of the natural keys of the records in a JSON Lines log.
+
+    Kept in a dbm file next to the log, so membership checks cost neither
+    memory nor a scan of the log. On open it catches up with whatever was
+    appended since it last looked (by any writer), and rebuilds itself when
+    the log was rewritten by compaction. Give indexes on other fields of the
+    same log their own ``name``.
+
+        with KeyIndex(log, ('user_id', 'completed_at')) as index:
+            if record not in index: ...
+    """
+
+    def __init__(self, log, key_fields, name='keys'):
+        self.log = log
+        self.key_fields = key_fields
+        self.path = f"{log.path}.{name}"
+        self._db = None
+
+    def key(self, record):
+        return json.dumps([record.get(field) for field in self.key_fields]).encode('utf-8')
+
+    def __contains__(self, record):
+        return self.key(record) in self._db
+
+    def __enter__(self):
+        _thread_lock(self.path).acquire()
+        try:
+            self._db = dbm.open(self.path, 'c')
+            self._catch_up()
+        except Exception:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        _thread_lock(self.path).release()
+
+    def _catch_up(self):
+        if not self.log.exists():
+            return
+        stat = os.stat(self.log.path)
+        inode = str(stat.st_ino).encode()
+        offset = int(self._db.get(b'__offset__', b'0'))
+        if self._db.get(b'__inode__') != inode or offset > stat.st_size:
+            # New or compacted log: index it from the start
+            self._db.close()
+            self._db = dbm.open(self.path, 'n')
+            self._db[b'__inode__'] = inode
+            offset = 0
+
+        with open(self.log.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # an append still in progress
+                offset += len(line)
+                record = JsonlLog._parse(line)
+                if record is not None:
+                    self._db[self.key(record)] = b"1"
+        self._db[b'__offset__'] = str(offset).encode()
+
+
+def migrate_json_file(json_path, jsonl_path):
+    """One-time conversion of a JSON array (or single object) file to JSON Lines.
+
+    The records are written to a temporary file that only replaces
+    ``jsonl_path`` once complete, so a run interrupted part way leaves
+    nothing behind to be appended to again. The original is kept as
+    ``<name>.migrated``. Returns True if a file was migrated.
+    """
+    if not os.path.exists(json_path):
+        return False
+
+    # Another process starting up at the same time may be migrating it too
+    with JsonlLog(jsonl_path)._locked():
+        if not os.path.exists(json_path):
+            return False
+
+        with open(json_path, 'r') as f:
+            first = f.read(1)
+            while first and first.isspace():
+                first = f.read(1)
+
+        if first == '[':
+            records = iter_json_array(json_path)
+        elif first == '{':
+            with open(json_path, 'r') as f:
+                records = [json.load(f)]
+        else:
+            records = []
+
+        tmp_path = f"{jsonl_path}.migrating"
+        with open(tmp_path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':')) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, jsonl_path)
+
+        os.replace(json_path, f"{json_path}.migrated")
+    return True
@@ -0,0 +1,75 @@
+# modules/llm_client.py
+import os
+import threading
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+
+load_dotenv()
+
+# HTTP/2 needs the optional h2 package
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+DEFAULT_MODEL = "llama-3.1-70b-versatile"
+
+# Transport settings (override in .env)
+POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))
+KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "120"))
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+
+_http_client = None
+_models = {}
+_lock = threading.Lock()
+
+
+def request_timeout():
+    """Generations stream slowly; connecting should not"""
+    return httpx.Timeout(
+        connect=CONNECT_TIMEOUT,
+        read=READ_TIMEOUT,
+        write=10.0,
+        pool=CONNECT_TIMEOUT
+    )
+
+
+def get_http_client():
+    """Get the process-wide pooled HTTP client (singleton)"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=POOL_SIZE,
+                    max_keepalive_connections=POOL_SIZE,
+                    keepalive_expiry=KEEPALIVE_SECONDS
+                ),
+                timeout=request_timeout()
+            )
+    return _http_client
+
+
+def create_chat_model(model=DEFAULT_MODEL, temperature=0.7):
+    """Get a chat model that shares the pooled transport with every other one"""
+    key = (model, temperature)
+    http_client = get_http_client()
+    with _lock:
+        if key not in _models:
+            _models[key] = ChatOpenAI(
+                model=model,
+                api_key=os.getenv("GROQ_API_KEY"),
+                base_url=GROQ_BASE_URL,
+                temperature=temperature,
+                http_client=http_client,
+                # ChatOpenAI sends its own timeout (None by default) with every
+                # request, which would override the client's
+                timeout=request_timeout(),
+                stream_usage=True
+            )
+        return _models[key]
@@ -0,0 +1,183 @@
+# modules/metrics.py
+import json
+import math
+import time
+import bisect
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# Seconds, tuned for LLM round trips
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+
+class Histogram:
+    """Bucketed histogram that also keeps a window of recent values for percentiles"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=1000):
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = value if self.max is None else max(self.max, value)
+            self.recent.append(value)
+
+    def percentile(self, q):
+        """Percentile (0-100) over the recent window, or None when empty"""
+        with self._lock:
+            values = sorted(self.recent)
+        if not values:
+            return None
+        rank = max(0, math.ceil(q / 100 * len(values)) - 1)
+        return values[rank]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_key, extra=None):
+    pairs = list(label_key) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class MetricsRegistry:
+    """In-process registry of counters and histograms"""
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """Increment a counter"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        """Record a value in a histogram"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def counter(self, name, **labels):
+        """Current value of a counter"""
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def histogram(self, name, **labels):
+        """Get a histogram, or None if nothing was observed yet"""
+        with self._lock:
+            return self._histograms.get((name, _label_key(labels)))
+
+    def to_dict(self):
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = list(self._histograms.items())
+        return {
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(counters)
+            ],
+            'histograms': [
+                {'name': name, 'labels': dict(labels), **histogram.summary()}
+                for (name, labels), histogram in sorted(histograms, key=lambda item: item[0])
+            ]
+        }
+
+    def to_json(self, indent=2):
+        """Dump all metrics as JSON"""
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self):
+        """Dump all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+
+        lines = []
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            with histogram._lock:
+                bucket_counts = list(histogram.bucket_counts)
+                count, total = histogram.count, histogram.sum
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+# When the current unit of work was queued (perf_counter), for queue-wait accounting
+_enqueued_at = contextvars.ContextVar('enqueued_at', default=None)
+
+
+@contextmanager
+def queued_since(enqueued_at):
+    """Mark the work run inside this block as queued at ``enqueued_at``"""
+    token = _enqueued_at.set(enqueued_at)
+    try:
+        yield
+    finally:
+        _enqueued_at.reset(token)
+
+
+def pop_queue_wait():
+    """Seconds the current work waited in a queue, reported once per unit of work"""
+    enqueued_at = _enqueued_at.get()
+    if enqueued_at is None:
+        return None
+    _enqueued_at.set(None)
+    return max(0.0, time.perf_counter() - enqueued_at)
+
+
+# Global metrics registry
+_registry = MetricsRegistry()
+
+def get_metrics():
+    """Get the process-wide metrics registry"""
+    return _registry
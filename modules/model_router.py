@@ -0,0 +1,138 @@
+# modules/model_router.py
+import os
+import json
+import random
+import threading
+from collections import deque
+
+from modules.llm_client import DEFAULT_MODEL
+
+FAST_MODEL = "llama-3.1-8b-instant"
+
+# First matching rule wins; anything unmatched goes to the default model.
+# Rules may restrict question types, content size and quality tiers.
+DEFAULT_ROUTES = [
+    {'question_types': ['tf'], 'max_chars': 4000, 'tiers': ['fast', 'standard'], 'model': FAST_MODEL},
+    {'question_types': ['mcq'], 'max_chars': 1500, 'tiers': ['fast'], 'model': FAST_MODEL},
+]
+
+
+class ModelStats:
+    """Rolling latency and parse-success window for one model"""
+
+    def __init__(self, window=100):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+
+    @property
+    def samples(self):
+        return len(self.outcomes)
+
+    @property
+    def success_rate(self):
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else None
+
+    @property
+    def median_latency(self):
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        return values[len(values) // 2]
+
+    def to_dict(self):
+        return {
+            'samples': self.samples,
+            'success_rate': self.success_rate,
+            'median_latency': self.median_latency
+        }
+
+
+class ModelRouter:
+    """Maps question type, content size and quality tier to a model.
+
+    A routed (cheaper) model only gets all of its traffic once it has shown
+    an acceptable parse-success rate and is not slower than the default
+    model; until then it receives a small exploration share.
+    """
+
+    def __init__(self, routes=None, default_model=DEFAULT_MODEL,
+                 min_success_rate=0.9, min_samples=20, explore_rate=0.2, demoted_rate=0.05):
+        if routes is None:
+            configured = os.getenv("LLM_ROUTES")
+            routes = json.loads(configured) if configured else DEFAULT_ROUTES
+        self.routes = routes
+        self.default_model = default_model
+        self.min_success_rate = min_success_rate
+        self.min_samples = min_samples
+        self.explore_rate = explore_rate
+        self.demoted_rate = demoted_rate
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, model):
+        with self._lock:
+            if model not in self.stats:
+                self.stats[model] = ModelStats()
+            return self.stats[model]
+
+    def configured_model(self, question_type, content_chars, tier='standard'):
+        """The model the routing rules pick, before any quality check"""
+        for rule in self.routes:
+            if 'question_types' in rule and question_type not in rule['question_types']:
+                continue
+            if 'max_chars' in rule and content_chars > rule['max_chars']:
+                continue
+            if 'tiers' in rule and tier not in rule['tiers']:
+                continue
+            return rule['model']
+        return self.default_model
+
+    def traffic_share(self, model):
+        """Fraction of matching requests currently sent to a routed model"""
+        candidate = self._stats(model)
+        if candidate.samples < self.min_samples:
+            return self.explore_rate
+
+        baseline = self._stats(self.default_model)
+        fast_enough = (baseline.median_latency is None
+                       or candidate.median_latency <= baseline.median_latency)
+        if candidate.success_rate >= self.min_success_rate and fast_enough:
+            return 1.0
+        return self.demoted_rate
+
+    def choose(self, question_type, content_chars, tier='standard'):
+        """Pick the model for one request"""
+        model = self.configured_model(question_type, content_chars, tier)
+        if model == self.default_model:
+            return model
+        return model if random.random() < self.traffic_share(model) else self.default_model
+
+    def alternate(self, model):
+        """A different model to fall back or hedge to"""
+        return self.default_model if model != self.default_model else FAST_MODEL
+
+    def record(self, model, latency, parsed):
+        """Record the latency and parse outcome of one call"""
+        stats = self._stats(model)
+        with self._lock:
+            stats.latencies.append(latency)
+            stats.outcomes.append(1 if parsed else 0)
+
+    def summary(self):
+        """Per-model latency and parse-success rates"""
+        with self._lock:
+            models = list(self.stats.items())
+        return {model: {**stats.to_dict(), 'traffic_share': self.traffic_share(model) if model != self.default_model else None}
+                for model, stats in models}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_model_router():
+    """Get the process-wide model router (singleton), so every generator learns from the same stats"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
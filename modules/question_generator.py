@@ -1,25 +1,210 @@
 import os
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 import json
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.llm_client import create_chat_model, DEFAULT_MODEL
+from modules.retrieval_index import get_index_store, document_hash
+from modules.chunk_cache import ChunkQuestionStore, content_defined_chunks, chunk_hash
+from modules.metrics import get_metrics, pop_queue_wait
+from modules.semantic_cache import get_semantic_cache
+from modules.model_router import get_model_router
+from modules.hedging import HedgeCancelled, get_hedge_budget, hedged_call
+from modules.circuit_breaker import CircuitBreaker, get_circuit_breaker
 
 load_dotenv()
 
+MAX_CONTENT_CHARS = 2000
+
+# Extra attempts when the model returns something that is not valid JSON
+PARSE_RETRIES = int(os.getenv("LLM_PARSE_RETRIES", "1"))
+
+# Hedged requests: duplicate a call that is slower than this latency percentile
+HEDGING_ENABLED = os.getenv("LLM_HEDGING", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = 20
+# 'same' re-sends to the same model, 'alternate' to the router's other model
+HEDGE_TARGET = os.getenv("LLM_HEDGE_TARGET", "same")
+# At most this fraction of requests may be hedged
+HEDGE_BUDGET_RATIO = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+
+# Circuit breaker: consecutive failures before failing fast, and for how long
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+
+def parse_questions(result):
+    """Parse the JSON question list out of a model response"""
+    json_match = re.search(r'```json\s*(.*?)\s*```', result, re.DOTALL)
+    if json_match:
+        result = json_match.group(1)
+    return json.loads(result)
+
+
 class QuestionGenerator:
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            model="llama-3.1-70b-versatile",
-            api_key=os.getenv("GROQ_API_KEY"),
-            base_url="https://api.groq.com/openai/v1",
-            temperature=0.7
+    def __init__(self, database=None, hedging=None):
+        self.database = database
+        self.hedging = HEDGING_ENABLED if hedging is None else hedging
+        self.model_name = DEFAULT_MODEL
+        self.llm = create_chat_model(self.model_name, temperature=0.7)
+        self.metrics = get_metrics()
+        self.router = get_model_router()
+        self.hedge_budget = get_hedge_budget(HEDGE_BUDGET_RATIO)
+        self.breaker = get_circuit_breaker('llm', BREAKER_FAILURES, BREAKER_COOLDOWN, metrics=self.metrics)
+        self.chunk_store = ChunkQuestionStore()
+        self.semantic_cache = get_semantic_cache()
+        self._generators = {
+            'mcq': self.generate_mcq,
+            'tf': self.generate_true_false,
+            'sa': self.generate_short_answer
+        }
+    
+    def _stream(self, llm, prompt, labels, cancel_event=None):
+        """Stream one completion, recording latency, time-to-first-token and tokens"""
+        start = time.perf_counter()
+        parts = []
+        usage = None
+        first_token_at = None
+        
+        try:
+            for chunk in llm.stream(prompt):
+                if cancel_event is not None and cancel_event.is_set():
+                    # Leaving the loop closes the stream and its connection
+                    raise HedgeCancelled()
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    self.metrics.observe('llm_time_to_first_token_seconds', first_token_at - start, **labels)
+                parts.append(chunk.content)
+                if getattr(chunk, 'usage_metadata', None):
+                    usage = chunk.usage_metadata
+        except HedgeCancelled:
+            self.metrics.inc('llm_requests_total', outcome='cancelled', **labels)
+            raise
+        except Exception:
+            if cancel_event is not None and cancel_event.is_set():
+                # A loser that timed out after the race was decided is not a backend failure
+                self.metrics.inc('llm_requests_total', outcome='cancelled', **labels)
+                raise HedgeCancelled()
+            self.metrics.inc('llm_requests_total', outcome='error', **labels)
+            self.metrics.observe('llm_latency_seconds', time.perf_counter() - start, **labels)
+            raise
+        
+        self.metrics.inc('llm_requests_total', outcome='ok', **labels)
+        self.metrics.observe('llm_latency_seconds', time.perf_counter() - start, **labels)
+        if usage:
+            token_buckets = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+            self.metrics.observe('llm_prompt_tokens', usage.get('input_tokens', 0), buckets=token_buckets, **labels)
+            self.metrics.observe('llm_completion_tokens', usage.get('output_tokens', 0), buckets=token_buckets, **labels)
+            self.metrics.inc('llm_prompt_tokens_total', usage.get('input_tokens', 0), **labels)
+            self.metrics.inc('llm_completion_tokens_total', usage.get('output_tokens', 0), **labels)
+        return "".join(parts)
+    
+    def _llm_for(self, model):
+        """Chat model client for a routed model name"""
+        if model == self.model_name:
+            return self.llm
+        return create_chat_model(model, temperature=0.7)
+    
+    def _attempt(self, prompt, question_type, model, cancel_event=None):
+        """One LLM call plus JSON parsing; raises ValueError on unparseable output"""
+        labels = {'model': model, 'question_type': question_type}
+        self.breaker.before_call()
+        start = time.perf_counter()
+        try:
+            result = self._stream(self._llm_for(model), prompt, labels, cancel_event)
+        except HedgeCancelled:
+            # A cancelled loser says nothing about the backend's health
+            self.breaker.release_trial()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            self.router.record(model, time.perf_counter() - start, parsed=False)
+            raise
+        self.breaker.record_success()
+        latency = time.perf_counter() - start
+        
+        try:
+            questions = parse_questions(result)
+        except ValueError:
+            self.router.record(model, latency, parsed=False)
+            self.metrics.inc('llm_parse_total', outcome='failure', **labels)
+            raise
+        
+        self.router.record(model, latency, parsed=True)
+        self.metrics.inc('llm_parse_total', outcome='success', **labels)
+        return questions
+    
+    def _hedge_delay(self, question_type, model):
+        """Recent latency percentile after which a request gets hedged"""
+        histogram = self.metrics.histogram('llm_latency_seconds', model=model, question_type=question_type)
+        if histogram is None or histogram.count < HEDGE_MIN_SAMPLES:
+            return None
+        return histogram.percentile(HEDGE_PERCENTILE)
+    
+    def _hedged_attempt(self, prompt, question_type, model):
+        """Like _attempt, but races a duplicate request once the primary is slow"""
+        delay = self._hedge_delay(question_type, model)
+        if delay is None:
+            return self._attempt(prompt, question_type, model)
+        
+        backup_model = self.router.alternate(model) if HEDGE_TARGET == 'alternate' else model
+        questions, hedged, winner = hedged_call(
+            lambda cancel: self._attempt(prompt, question_type, model, cancel),
+            lambda cancel: self._attempt(prompt, question_type, backup_model, cancel),
+            delay,
+            self.hedge_budget
         )
+        if hedged:
+            self.metrics.inc('llm_hedges_total', outcome=f'{winner}_won', model=model, question_type=question_type)
+        return questions
+    
+    def _invoke(self, prompt, question_type, model=None):
+        """Call the LLM and parse its JSON, retrying unparseable responses"""
+        model = model or self.model_name
+        labels = {'model': model, 'question_type': question_type}
+        
+        queue_wait = pop_queue_wait()
+        if queue_wait is not None:
+            self.metrics.observe('llm_queue_wait_seconds', queue_wait, **labels)
+        
+        for attempt in range(PARSE_RETRIES + 1):
+            try:
+                if self.hedging:
+                    questions = self._hedged_attempt(prompt, question_type, model)
+                else:
+                    questions = self._attempt(prompt, question_type, model)
+            except ValueError:
+                continue
+            
+            self.metrics.observe('llm_retries', attempt, buckets=(0, 1, 2, 3, 5), **labels)
+            return questions
+        
+        self.metrics.observe('llm_retries', PARSE_RETRIES, buckets=(0, 1, 2, 3, 5), **labels)
+        raise ValueError(f"Model response was not valid JSON after {PARSE_RETRIES + 1} attempts")
+    
+    def _select_content(self, content, topic=None):
+        """Narrow long material down to the chunks most relevant to the topic"""
+        if not topic or len(content) <= MAX_CONTENT_CHARS:
+            return content
+        
+        try:
+            index = get_index_store().get_or_build(content)
+            relevant = index.relevant_content(topic, max_chars=MAX_CONTENT_CHARS)
+            if relevant:
+                return relevant
+        except Exception as e:
+            print(f"Error querying retrieval index: {e}")
+        return content
     
-    def generate_mcq(self, content, num_questions=5):
+    def generate_mcq(self, content, num_questions=5, topic=None, tier='standard'):
+        content = self._select_content(content, topic)
+        model = self.router.choose('mcq', len(content), tier)
         prompt = f"""You are an expert educational content creator. Generate {num_questions} multiple choice questions from the following content.
 
 Content:
-{content[:2000]}
+{content[:MAX_CONTENT_CHARS]}
 
 Requirements:
 1. Questions should test understanding, not just memorization
@@ -46,22 +231,18 @@ Return format (JSON array):
 Generate the questions now:"""
         
         try:
-            response = self.llm.invoke(prompt)
-            result = response.content
-            json_match = re.search(r'```json\s*(.*?)\s*```', result, re.DOTALL)
-            if json_match:
-                result = json_match.group(1)
-            questions = json.loads(result)
-            return questions
+            return self._invoke(prompt, 'mcq', model)
         except Exception as e:
             print(f"Error generating MCQ: {e}")
             return []
     
-    def generate_true_false(self, content, num_questions=5):
+    def generate_true_false(self, content, num_questions=5, topic=None, tier='standard'):
+        content = self._select_content(content, topic)
+        model = self.router.choose('tf', len(content), tier)
         prompt = f"""Generate {num_questions} True/False questions from this content.
 
 Content:
-{content[:2000]}
+{content[:MAX_CONTENT_CHARS]}
 
 Requirements:
 1. Create clear statements that are definitively true or false
@@ -81,22 +262,18 @@ Return format:
 Generate the questions:"""
         
         try:
-            response = self.llm.invoke(prompt)
-            result = response.content
-            json_match = re.search(r'```json\s*(.*?)\s*```', result, re.DOTALL)
-            if json_match:
-                result = json_match.group(1)
-            questions = json.loads(result)
-            return questions
+            return self._invoke(prompt, 'tf', model)
         except Exception as e:
             print(f"Error generating T/F: {e}")
             return []
     
-    def generate_short_answer(self, content, num_questions=3):
+    def generate_short_answer(self, content, num_questions=3, topic=None, tier='standard'):
+        content = self._select_content(content, topic)
+        model = self.router.choose('sa', len(content), tier)
         prompt = f"""Generate {num_questions} short answer questions from this content.
 
 Content:
-{content[:2000]}
+{content[:MAX_CONTENT_CHARS]}
 
 Requirements:
 1. Questions should require 2-3 sentence answers
@@ -116,13 +293,132 @@ Return format:
 Generate the questions:"""
         
         try:
-            response = self.llm.invoke(prompt)
-            result = response.content
-            json_match = re.search(r'```json\s*(.*?)\s*```', result, re.DOTALL)
-            if json_match:
-                result = json_match.group(1)
-            questions = json.loads(result)
-            return questions
+            return self._invoke(prompt, 'sa', model)
         except Exception as e:
             print(f"Error generating short answer: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    def _budget_chunks(self, content, num_questions):
+        """Chunks covering the first MAX_CONTENT_CHARS of the material, at most one per question"""
+        chunks = []
+        used = 0
+        for chunk in content_defined_chunks(content):
+            if chunks and (used + len(chunk) > MAX_CONTENT_CHARS or len(chunks) >= num_questions):
+                break
+            chunks.append(chunk)
+            used += len(chunk)
+        return chunks
+    
+    def generate_incremental(self, content, question_type, num_questions=5, topic=None, tier='standard',
+                             executor=None):
+        """Generate questions chunk by chunk, reusing questions for unchanged chunks.
+        
+        Only the same MAX_CONTENT_CHARS a single prompt would see are used,
+        so long documents cost a few LLM calls at most, not one per chunk.
+        Pass ``executor`` to run the LLM calls on a pool shared with other
+        callers instead of a private one.
+        """
+        content = self._select_content(content, topic)
+        chunks = self._budget_chunks(content, num_questions)
+        
+        # Report queue wait once, before work fans out to other threads
+        queue_wait = pop_queue_wait()
+        if queue_wait is not None:
+            self.metrics.observe('llm_queue_wait_seconds', queue_wait, model=self.model_name, question_type=question_type)
+        if not chunks:
+            return []
+        
+        generate = self._generators[question_type]
+        total_chars = sum(len(c) for c in chunks)
+        
+        # Share the requested questions across chunks by size
+        plan = []
+        for chunk in chunks:
+            wanted = max(1, round(num_questions * len(chunk) / total_chars))
+            plan.append((chunk, chunk_hash(chunk), wanted))
+        
+        per_chunk = {}
+        missing = []
+        for chunk, digest, wanted in plan:
+            cached = self.chunk_store.get(question_type, digest)
+            if cached and len(cached) >= wanted:
+                per_chunk[digest] = cached
+            else:
+                missing.append((chunk, digest, wanted))
+        
+        # Only new or edited chunks go to the LLM
+        if missing:
+            call = lambda item: generate(item[0], item[2], tier=tier)
+            if executor is not None:
+                results = list(executor.map(call, missing))
+            else:
+                with ThreadPoolExecutor(max_workers=min(4, len(missing))) as pool:
+                    results = list(pool.map(call, missing))
+            for (chunk, digest, wanted), questions in zip(missing, results):
+                if questions:
+                    self.chunk_store.put(question_type, digest, questions)
+                per_chunk[digest] = questions
+        
+        # Interleave so every chunk is represented before any repeats
+        pools = [list(per_chunk.get(digest) or []) for _, digest, _ in plan]
+        selected = []
+        while len(selected) < num_questions and any(pools):
+            for pool in pools:
+                if pool and len(selected) < num_questions:
+                    selected.append(pool.pop(0))
+        return selected
+    
+    def _has_known_chunks(self, material, question_type, num_questions):
+        """Whether questions are already stored for any chunk of this material"""
+        return any(self.chunk_store.get(question_type, chunk_hash(chunk))
+                   for chunk in self._budget_chunks(material, num_questions))
+    
+    def generate(self, content, question_type, num_questions=5, topic=None, user_id=None, tier='standard',
+                 executor=None):
+        """Generate questions, serving them from the question bank when possible"""
+        material = self._select_content(content, topic)
+        content_hash = document_hash(material)
+        
+        if self.database is not None:
+            banked = self.database.get_banked_questions(content_hash, question_type, limit=num_questions)
+            if len(banked) >= num_questions:
+                return banked
+        
+        # Revised material goes through the chunk store, which regenerates only
+        # the edited chunks; a similar whole-material hit would hide them
+        if not self._has_known_chunks(material, question_type, num_questions):
+            cached = self.semantic_cache.lookup(material, question_type, num_questions)
+            if cached:
+                return cached
+        
+        # Backend is failing: serve whatever we already have instead of waiting
+        if self.breaker.state == CircuitBreaker.OPEN:
+            return self._fallback_questions(material, content_hash, question_type, num_questions)
+        
+        questions = self.generate_incremental(material, question_type, num_questions, tier=tier,
+                                              executor=executor)
+        
+        if questions:
+            self.semantic_cache.store(material, question_type, questions)
+            if self.database is not None:
+                self.database.add_to_question_bank(user_id, questions, question_type, content_hash)
+        return questions
+    
+    def _fallback_questions(self, material, content_hash, question_type, num_questions):
+        """Best-effort questions for this material without calling the LLM"""
+        self.metrics.inc('circuit_fallback_total', question_type=question_type)
+        
+        if self.database is not None:
+            banked = self.database.get_banked_questions(content_hash, question_type, limit=num_questions)
+            if banked:
+                return banked
+        
+        questions = []
+        for chunk in self._budget_chunks(material, num_questions):
+            questions.extend(self.chunk_store.get(question_type, chunk_hash(chunk)) or [])
+            if len(questions) >= num_questions:
+                return questions[:num_questions]
+        if questions:
+            return questions
+        
+        return self.semantic_cache.lookup(material, question_type, 1) or []
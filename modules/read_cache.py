@@ -0,0 +1,80 @@
+# modules/read_cache.py
+import os
+import copy
+import time
+import threading
+from collections import OrderedDict
+
+from modules.metrics import get_metrics
+
+
+class ReadCache:
+    """Per-user read-through cache with a TTL and a bounded (LRU) size.
+
+    Keys are ``(method, user_id, *args)``. ``invalidate(user_id)`` drops
+    every entry of that user and bumps the user's generation, so a read
+    that started before the write cannot put a stale value back.
+    """
+
+    def __init__(self, ttl=None, max_entries=None, metrics=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("READ_CACHE_TTL", "30"))
+        self.max_entries = max_entries or int(os.getenv("READ_CACHE_MAX_ENTRIES", "1000"))
+        self.metrics = metrics or get_metrics()
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(self, method, user_id, args, loader):
+        """Cached result of ``loader()``, loading it on a miss"""
+        key = (method, user_id, *args)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.metrics.inc('db_read_cache_requests_total', outcome='hit', method=method)
+                return copy.deepcopy(entry[1])
+            generation = (self._epoch, self._generations.get(user_id, 0))
+
+        self.metrics.inc('db_read_cache_requests_total', outcome='miss', method=method)
+        value = loader()
+
+        with self._lock:
+            if (self._epoch, self._generations.get(user_id, 0)) == generation:
+                self._entries[key] = (time.monotonic(), value)
+                self._entries.move_to_end(key)
+                self._user_keys.setdefault(user_id, set()).add(key)
+                while len(self._entries) > self.max_entries:
+                    old_key, _ = self._entries.popitem(last=False)
+                    self._user_keys.get(old_key[1], set()).discard(old_key)
+        return copy.deepcopy(value)
+
+    def invalidate(self, user_id):
+        """Drop every cached read of a user"""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for key in self._user_keys.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every cached read"""
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._user_keys.clear()
+
+    def stats(self):
+        """Hit/miss counts and hit rate since the process started"""
+        methods = ('quiz_history', 'user_stats', 'daily_rollups')
+        hits = sum(self.metrics.counter('db_read_cache_requests_total', outcome='hit', method=m) for m in methods)
+        misses = sum(self.metrics.counter('db_read_cache_requests_total', outcome='miss', method=m) for m in methods)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+            'entries': len(self._entries),
+            'ttl': self.ttl
+        }
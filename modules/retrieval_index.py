@@ -0,0 +1,210 @@
+# modules/retrieval_index.py
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import linear_kernel
+
+
+def document_hash(text):
+    """Stable identifier for a piece of study material"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def chunk_text(text, words_per_chunk=150, overlap=30):
+    """Split text into overlapping word windows"""
+    words = text.split()
+    if not words:
+        return []
+
+    step = max(1, words_per_chunk - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunk = ' '.join(words[start:start + words_per_chunk])
+        if chunk.strip():
+            chunks.append(chunk)
+        if start + words_per_chunk >= len(words):
+            break
+    return chunks
+
+
+class RetrievalIndex:
+    """TF-IDF index over the chunks of a single document"""
+
+    def __init__(self, chunks, vectorizer, matrix):
+        self.chunks = chunks
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+
+    @classmethod
+    def build(cls, text, words_per_chunk=150, overlap=30):
+        """Chunk the text and fit a TF-IDF matrix over the chunks"""
+        chunks = chunk_text(text, words_per_chunk, overlap)
+        if not chunks:
+            return cls([], None, None)
+
+        vectorizer = TfidfVectorizer(stop_words='english', sublinear_tf=True)
+        try:
+            matrix = vectorizer.fit_transform(chunks)
+        except ValueError:
+            # Only stop words / empty vocabulary
+            return cls(chunks, None, None)
+        return cls(chunks, vectorizer, matrix)
+
+    def search(self, query, top_k=5):
+        """Return (chunk_position, score) pairs for the best matching chunks"""
+        if self.vectorizer is None or not query or not query.strip():
+            return []
+
+        query_vector = self.vectorizer.transform([query])
+        scores = linear_kernel(query_vector, self.matrix)[0]
+        ranked = scores.argsort()[::-1][:top_k]
+        return [(int(i), float(scores[i])) for i in ranked if scores[i] > 0]
+
+    def relevant_content(self, query, max_chars=2000, top_k=8):
+        """Join the most relevant chunks, in document order, up to max_chars"""
+        hits = self.search(query, top_k)
+        if not hits:
+            return None
+
+        selected = []
+        used = 0
+        for position, _ in hits:
+            chunk = self.chunks[position]
+            if used + len(chunk) > max_chars and selected:
+                break
+            selected.append(position)
+            used += len(chunk) + 2
+
+        return "\n\n".join(self.chunks[p] for p in sorted(selected))
+
+    def to_files(self):
+        """Split the index into (arrays, metadata) for np.savez and json"""
+        meta = {'chunks': self.chunks, 'vocabulary': None}
+        if self.vectorizer is None:
+            return {}, meta
+
+        matrix = self.matrix.tocsr()
+        meta['vocabulary'] = {term: int(i) for term, i in self.vectorizer.vocabulary_.items()}
+        arrays = {
+            'data': matrix.data,
+            'indices': matrix.indices,
+            'indptr': matrix.indptr,
+            'shape': np.array(matrix.shape),
+            'idf': self.vectorizer.idf_
+        }
+        return arrays, meta
+
+    @classmethod
+    def from_files(cls, arrays, meta):
+        """Rebuild an index saved by to_files without refitting"""
+        if meta.get('vocabulary') is None:
+            return cls(meta['chunks'], None, None)
+
+        vectorizer = TfidfVectorizer(stop_words='english', sublinear_tf=True)
+        vectorizer.vocabulary_ = meta['vocabulary']
+        vectorizer.idf_ = arrays['idf']
+        matrix = sparse.csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']),
+            shape=tuple(arrays['shape'])
+        )
+        return cls(meta['chunks'], vectorizer, matrix)
+
+
+class RetrievalIndexStore:
+    """Persists one RetrievalIndex per document under data/indexes"""
+
+    def __init__(self, index_dir=os.path.join("data", "indexes"), max_cached=16):
+        self.index_dir = index_dir
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def _paths(self, doc_id):
+        base = os.path.join(self.index_dir, doc_id)
+        return f"{base}.npz", f"{base}.json"
+
+    def _replace(self, path, write):
+        """Write through a temp file of our own, then move it into place"""
+        with tempfile.NamedTemporaryFile(dir=self.index_dir, suffix='.tmp', delete=False) as f:
+            tmp_path = f.name
+            try:
+                write(f)
+            except Exception:
+                f.close()
+                os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, path)
+
+    def _load(self, doc_id):
+        """Load a saved index, or None if it is missing"""
+        arrays_path, meta_path = self._paths(doc_id)
+        # The metadata is written last, so without it the index is incomplete
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        arrays = {}
+        if meta.get('vocabulary') is not None:
+            with np.load(arrays_path, allow_pickle=False) as saved:
+                arrays = {name: saved[name] for name in saved.files}
+        return RetrievalIndex.from_files(arrays, meta)
+
+    def _save(self, doc_id, index):
+        """Persist an index as an npz of arrays plus a JSON sidecar"""
+        arrays_path, meta_path = self._paths(doc_id)
+        arrays, meta = index.to_files()
+        if arrays:
+            self._replace(arrays_path, lambda f: np.savez(f, **arrays))
+        self._replace(meta_path, lambda f: f.write(json.dumps(meta).encode('utf-8')))
+
+    def _remember(self, doc_id, index):
+        with self._lock:
+            self._cache[doc_id] = index
+            self._cache.move_to_end(doc_id)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def get_or_build(self, text):
+        """Load the persisted index for this text, building it on first use"""
+        doc_id = document_hash(text)
+
+        with self._lock:
+            if doc_id in self._cache:
+                self._cache.move_to_end(doc_id)
+                return self._cache[doc_id]
+
+        try:
+            index = self._load(doc_id)
+            if index is not None:
+                self._remember(doc_id, index)
+                return index
+        except Exception as e:
+            print(f"Error loading retrieval index: {e}")
+
+        index = RetrievalIndex.build(text)
+        try:
+            self._save(doc_id, index)
+        except Exception as e:
+            print(f"Error saving retrieval index: {e}")
+
+        self._remember(doc_id, index)
+        return index
+
+
+# Global index store
+_index_store = None
+
+def get_index_store():
+    """Get retrieval index store instance (singleton)"""
+    global _index_store
+    if _index_store is None:
+        _index_store = RetrievalIndexStore()
+    return _index_store
@@ -0,0 +1,158 @@
+# modules/scheduler.py
+import os
+import time
+import heapq
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from modules.metrics import get_metrics, queued_since
+
+
+class QuotaExceeded(Exception):
+    """Raised when a user has used up their generation quota"""
+
+    def __init__(self, user_id, retry_after):
+        super().__init__(f"Generation quota exceeded for {user_id}, retry in {retry_after:.0f}s")
+        self.user_id = user_id
+        self.retry_after = retry_after
+
+
+def content_cost(content):
+    """Scheduling cost of generating from a piece of material"""
+    return 1.0 + len(content) / 10000
+
+
+class GenerationScheduler:
+    """Weighted fair queuing of generation requests across users.
+
+    Each user has their own FIFO queue. Requests get a virtual finish time
+    ``max(virtual_time, user's last finish) + cost / weight`` and workers
+    always run the request with the smallest finish time, so a user who
+    floods the queue only delays their own later requests. At most
+    ``max_concurrency`` requests run at once, and each user may submit at
+    most ``quota`` requests per ``quota_window`` seconds.
+    """
+
+    def __init__(self, max_concurrency=None, quota=None, quota_window=None, metrics=None):
+        self.max_concurrency = max_concurrency or int(os.getenv("GENERATION_CONCURRENCY", "4"))
+        self.quota = quota or int(os.getenv("GENERATION_QUOTA", "30"))
+        self.quota_window = quota_window or float(os.getenv("GENERATION_QUOTA_WINDOW", "3600"))
+        self.metrics = metrics or get_metrics()
+
+        self.weights = {}
+        self._queues = {}
+        self._finish_tags = {}
+        self._heap = []
+        self._submissions = {}
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"scheduler-{i}", daemon=True)
+            for i in range(self.max_concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def set_weight(self, user_id, weight):
+        """Give a user a larger (or smaller) share of the capacity"""
+        with self._cond:
+            self.weights[user_id] = weight
+
+    def _check_quota(self, user_id, now):
+        """Sliding-window quota; raises QuotaExceeded with a retry-after"""
+        history = self._submissions.setdefault(user_id, deque())
+        while history and now - history[0] >= self.quota_window:
+            history.popleft()
+        if len(history) >= self.quota:
+            retry_after = self.quota_window - (now - history[0])
+            self.metrics.inc('scheduler_rejections_total', user_id=user_id)
+            raise QuotaExceeded(user_id, retry_after)
+        history.append(now)
+
+    def submit(self, user_id, fn, args=(), kwargs=None, cost=1.0):
+        """Queue ``fn(*args, **kwargs)`` on behalf of a user and return a Future"""
+        kwargs = kwargs or {}
+        future = Future()
+        with self._cond:
+            now = time.monotonic()
+            self._check_quota(user_id, now)
+
+            weight = self.weights.get(user_id, 1.0)
+            start_tag = max(self._virtual_time, self._finish_tags.get(user_id, 0.0))
+            finish_tag = start_tag + cost / weight
+            self._finish_tags[user_id] = finish_tag
+
+            request = (finish_tag, next(self._sequence), user_id, fn, args, kwargs, future, time.perf_counter())
+            self._queues.setdefault(user_id, deque()).append(request)
+            heapq.heappush(self._heap, request[:3])
+            self.metrics.inc('scheduler_submitted_total', user_id=user_id)
+            self._cond.notify()
+        return future
+
+    def run(self, user_id, fn, args=(), kwargs=None, cost=1.0):
+        """Submit and wait for the result"""
+        return self.submit(user_id, fn, args, kwargs, cost).result()
+
+    def _next_request(self):
+        """Pop the queued request with the smallest virtual finish time"""
+        _, _, user_id = heapq.heappop(self._heap)
+        request = self._queues[user_id].popleft()
+        if not self._queues[user_id]:
+            del self._queues[user_id]
+        self._virtual_time = max(self._virtual_time, request[0])
+        return request
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, user_id, fn, args, kwargs, future, enqueued_at = self._next_request()
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            self.metrics.observe('scheduler_wait_seconds', time.perf_counter() - enqueued_at, user_id=user_id)
+            try:
+                with queued_since(enqueued_at):
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def queue_depths(self):
+        """Number of queued (not yet running) requests per user"""
+        with self._cond:
+            return {user_id: len(queue) for user_id, queue in self._queues.items()}
+
+    def user_stats(self, user_id):
+        """Queue depth, wait-time summary and remaining quota for a user"""
+        with self._cond:
+            depth = len(self._queues.get(user_id, ()))
+            now = time.monotonic()
+            history = self._submissions.get(user_id, deque())
+            used = sum(1 for t in history if now - t < self.quota_window)
+        wait = self.metrics.histogram('scheduler_wait_seconds', user_id=user_id)
+        return {
+            'queue_depth': depth,
+            'wait_seconds': wait.summary() if wait else None,
+            'quota_remaining': max(0, self.quota - used)
+        }
+
+
+# Global scheduler instance
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Get generation scheduler instance (singleton)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = GenerationScheduler()
+    return _scheduler
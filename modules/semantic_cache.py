@@ -0,0 +1,173 @@
+# modules/semantic_cache.py
+import os
+import json
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from modules.embeddings import get_embedder, cosine_similarities, EMBEDDING_DIM
+from modules.retrieval_index import chunk_text, document_hash
+from modules.chunk_cache import paragraph_hashes
+from modules.metrics import get_metrics
+
+
+class SemanticCache:
+    """Reuses questions generated for study material that is nearly the same.
+
+    Each entry keeps an embedding of the whole material; a request whose
+    material is at least ``threshold`` cosine-similar to a cached entry of
+    the same question type is served from that entry instead of the LLM.
+    Material that is a cached entry plus extra paragraphs is never served
+    from it, since nothing in the entry covers the added text.
+    """
+
+    def __init__(self, cache_dir=os.path.join("data", "semantic_cache"),
+                 threshold=None, max_entries=None, metrics=None):
+        self.cache_dir = cache_dir
+        self.threshold = threshold if threshold is not None else float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "500"))
+        # Material this much shorter or longer is never considered the same
+        self.max_length_ratio = 1.25
+        self.metrics = metrics or get_metrics()
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.entries_file = os.path.join(self.cache_dir, "entries.json")
+        self.vectors_file = os.path.join(self.cache_dir, "vectors.npy")
+        self.entries, self.vectors = self._load()
+
+    def _load(self):
+        """Load entries and their vectors from disk"""
+        try:
+            if os.path.exists(self.entries_file) and os.path.exists(self.vectors_file):
+                with open(self.entries_file, 'r') as f:
+                    entries = json.load(f)
+                vectors = np.load(self.vectors_file)
+                if len(entries) == len(vectors):
+                    return entries, vectors
+        except Exception as e:
+            print(f"Error loading semantic cache: {e}")
+        return [], np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    def _save(self):
+        """Write entries and vectors to disk"""
+        try:
+            with open(f"{self.entries_file}.tmp", 'w') as f:
+                json.dump(self.entries, f)
+            with open(f"{self.vectors_file}.tmp", 'wb') as f:
+                np.save(f, self.vectors)
+            os.replace(f"{self.entries_file}.tmp", self.entries_file)
+            os.replace(f"{self.vectors_file}.tmp", self.vectors_file)
+        except Exception as e:
+            print(f"Error saving semantic cache: {e}")
+
+    def _embed_material(self, content):
+        """Embed the whole material as the normalized mean of its chunk embeddings"""
+        embedder = get_embedder()
+        vectors = embedder.embed(chunk_text(content) or [content])
+        mean = vectors.mean(axis=0)
+        norm = np.linalg.norm(mean)
+        return embedder.model_name, (mean / norm if norm else mean)
+
+    def lookup(self, content, question_type, num_questions):
+        """Return cached questions for near-identical material, or None"""
+        model_name, vector = self._embed_material(content)
+        paragraphs = set(paragraph_hashes(content))
+
+        with self._lock:
+            best_index, best_score = None, -1.0
+            if len(self.entries):
+                scores = cosine_similarities(vector, self.vectors)
+                for i in np.argsort(scores)[::-1]:
+                    entry = self.entries[i]
+                    if scores[i] < self.threshold:
+                        break
+                    if (entry['question_type'] != question_type
+                            or entry['embedding_model'] != model_name
+                            or len(entry['questions']) < num_questions):
+                        continue
+                    ratio = max(entry['content_length'], len(content)) / max(1, min(entry['content_length'], len(content)))
+                    if ratio > self.max_length_ratio:
+                        continue
+                    cached_paragraphs = set(entry.get('paragraph_hashes') or ())
+                    if cached_paragraphs and cached_paragraphs < paragraphs:
+                        continue
+                    best_index, best_score = int(i), float(scores[i])
+                    break
+
+            if best_index is None:
+                self.metrics.inc('semantic_cache_requests_total', outcome='miss', question_type=question_type)
+                return None
+
+            entry = self.entries[best_index]
+            entry['hits'] = entry.get('hits', 0) + 1
+            self.metrics.inc('semantic_cache_requests_total', outcome='hit', question_type=question_type)
+            self.metrics.observe('semantic_cache_hit_similarity', best_score,
+                                 buckets=(0.9, 0.95, 0.97, 0.98, 0.99, 1.0), question_type=question_type)
+            return entry['questions'][:num_questions]
+
+    def store(self, content, question_type, questions):
+        """Cache the questions generated for this material"""
+        if not questions:
+            return
+        model_name, vector = self._embed_material(content)
+        content_hash = document_hash(content)
+
+        with self._lock:
+            # Replace an older entry for exactly the same material
+            keep = [i for i, e in enumerate(self.entries)
+                    if not (e['content_hash'] == content_hash and e['question_type'] == question_type)]
+            self.entries = [self.entries[i] for i in keep]
+            self.vectors = self.vectors[keep] if len(keep) else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+            self.entries.append({
+                'content_hash': content_hash,
+                'question_type': question_type,
+                'content_length': len(content),
+                'paragraph_hashes': paragraph_hashes(content),
+                'questions': questions,
+                'embedding_model': model_name,
+                'hits': 0,
+                'created_at': datetime.now().isoformat()
+            })
+            self.vectors = np.vstack([self.vectors, vector.astype(np.float32)[None, :]])
+
+            # Drop the oldest entries beyond the size limit
+            if len(self.entries) > self.max_entries:
+                overflow = len(self.entries) - self.max_entries
+                self.entries = self.entries[overflow:]
+                self.vectors = self.vectors[overflow:]
+
+            self._save()
+
+    def stats(self):
+        """Hit/miss counts and hit rate since the process started"""
+        hits = sum(self.metrics.counter('semantic_cache_requests_total', outcome='hit', question_type=t)
+                   for t in ('mcq', 'tf', 'sa'))
+        misses = sum(self.metrics.counter('semantic_cache_requests_total', outcome='miss', question_type=t)
+                     for t in ('mcq', 'tf', 'sa'))
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+            'entries': len(self.entries),
+            'threshold': self.threshold
+        }
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+def get_semantic_cache():
+    """Get the process-wide semantic cache (singleton).
+
+    Every instance rewrites the shared files from its own entries, so
+    there must be only one per process.
+    """
+    global _semantic_cache
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            _semantic_cache = SemanticCache()
+        return _semantic_cache
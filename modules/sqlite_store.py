@@ -0,0 +1,328 @@
+# modules/sqlite_store.py
+import os
+import json
+import uuid
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+from modules.jsonl_log import JsonlLog
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join("data", "study_assistant.db"))
+
+# Connections kept open for reuse; further concurrent operations wait for one
+POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "5"))
+POOL_TIMEOUT = float(os.getenv("SQLITE_POOL_TIMEOUT", "30"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quiz_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    questions_count INTEGER NOT NULL,
+    answers TEXT NOT NULL,
+    scores TEXT NOT NULL,
+    total_score REAL NOT NULL,
+    time_spent REAL,
+    completed_at TEXT NOT NULL,
+    result_id TEXT
+);
+DROP INDEX IF EXISTS quiz_results_user_completed_at;
+CREATE INDEX IF NOT EXISTS quiz_results_user_completed_at_id
+    ON quiz_results (user_id, completed_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS flashcard_progress (
+    user_id TEXT PRIMARY KEY,
+    total_cards INTEGER NOT NULL,
+    known_cards TEXT NOT NULL,
+    review_cards TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS question_bank (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    question_type TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    question TEXT NOT NULL,
+    embedding TEXT NOT NULL,
+    embedding_model TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS question_bank_material_type_created_at
+    ON question_bank (content_hash, question_type, created_at);
+CREATE INDEX IF NOT EXISTS question_bank_user
+    ON question_bank (user_id);
+
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    job_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    content TEXT NOT NULL,
+    question_type TEXT NOT NULL,
+    num_questions INTEGER NOT NULL,
+    topic TEXT,
+    status TEXT NOT NULL,
+    questions TEXT NOT NULL,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS generation_jobs_user_created_at
+    ON generation_jobs (user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS generation_jobs_status_created_at
+    ON generation_jobs (status, created_at);
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id TEXT PRIMARY KEY,
+    total_quizzes INTEGER NOT NULL DEFAULT 0,
+    score_sum REAL NOT NULL DEFAULT 0,
+    total_questions_answered INTEGER NOT NULL DEFAULT 0,
+    flashcards_known INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    quizzes INTEGER NOT NULL DEFAULT 0,
+    questions_answered INTEGER NOT NULL DEFAULT 0,
+    score_sum REAL NOT NULL DEFAULT 0,
+    time_spent REAL NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS imported_files (
+    path TEXT PRIMARY KEY,
+    imported_at TEXT NOT NULL
+);
+"""
+
+# Columns added after a table was first released: (table, column, type, value for existing rows)
+ADDED_COLUMNS = [
+    ('quiz_results', 'time_spent', 'REAL', None),
+    ('quiz_results', 'result_id', 'TEXT', "lower(hex(randomblob(16)))"),
+]
+
+# Indexes on added columns, created once the columns exist
+ADDED_INDEXES = """
+CREATE INDEX IF NOT EXISTS quiz_results_user_result_id
+    ON quiz_results (user_id, result_id);
+"""
+
+# Columns stored as JSON text, per table
+JSON_COLUMNS = {
+    'quiz_results': ('answers', 'scores'),
+    'flashcard_progress': ('known_cards', 'review_cards'),
+    'question_bank': ('question', 'embedding'),
+    'generation_jobs': ('questions',),
+    'user_stats': (),
+    'daily_rollups': (),
+}
+
+
+def encode_row(table, data):
+    """Copy of a record with its JSON columns serialized"""
+    row = dict(data)
+    for column in JSON_COLUMNS[table]:
+        if column in row:
+            row[column] = json.dumps(row[column])
+    return row
+
+
+def decode_row(table, row):
+    """Plain dict from a sqlite3.Row, with JSON columns parsed"""
+    data = dict(row)
+    for column in JSON_COLUMNS[table]:
+        if data.get(column) is not None:
+            data[column] = json.loads(data[column])
+    return data
+
+
+class SQLiteStore:
+    """SQLite database in WAL mode behind a bounded connection pool.
+
+    WAL lets readers run alongside the single writer. Every operation
+    checks a connection out of the pool and hands it back afterwards, so
+    short-lived threads (each Streamlit rerun, executor workers) reuse the
+    same few connections instead of each leaving one open.
+    """
+
+    def __init__(self, path=SQLITE_PATH, pool_size=POOL_SIZE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.pool_size = pool_size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            for table, column, column_type, fill in ADDED_COLUMNS:
+                columns = [row['name'] for row in conn.execute(f"PRAGMA table_info({table})")]
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                    if fill is not None:
+                        conn.execute(f"UPDATE {table} SET {column} = {fill}")
+                    conn.commit()
+            conn.executescript(ADDED_INDEXES)
+
+    def _open(self):
+        # Pooled connections move between threads, but only one uses each at a time
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Connection checked out of the pool for the duration of the block"""
+        conn = None
+        with self._lock:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                if self._opened < self.pool_size:
+                    self._opened += 1
+                    conn = False
+
+        if conn is False:
+            try:
+                conn = self._open()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        elif conn is None:
+            try:
+                conn = self._idle.get(timeout=POOL_TIMEOUT)
+            except queue.Empty:
+                raise sqlite3.OperationalError(f"No SQLite connection free after {POOL_TIMEOUT:.0f}s")
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Connection whose statements commit together (or roll back on error)"""
+        with self.connection() as conn:
+            with conn:
+                yield conn
+
+    def query(self, sql, params=()):
+        """All rows of one SELECT"""
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        """First row of one SELECT, or None"""
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def insert(self, conn, table, data):
+        """INSERT one record, returning its rowid"""
+        row = encode_row(table, data)
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" for _ in row)
+        cursor = conn.execute(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", tuple(row.values()))
+        return cursor.lastrowid
+
+    def upsert(self, conn, table, data, key):
+        """INSERT or replace the non-key columns of the row with the same key"""
+        row = encode_row(table, data)
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" for _ in row)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in row if c != key)
+        conn.execute(
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT({key}) DO UPDATE SET {updates}",
+            tuple(row.values())
+        )
+
+    def insert_missing(self, conn, table, data, key_columns):
+        """INSERT one record unless a row with the same key columns exists"""
+        row = encode_row(table, data)
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" for _ in row)
+        condition = " AND ".join(f"{column} = ?" for column in key_columns)
+        conn.execute(
+            f"INSERT INTO {table} ({columns}) SELECT {placeholders} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {condition})",
+            (*row.values(), *(row[column] for column in key_columns))
+        )
+
+    def close(self):
+        """Close the pooled connections that are not checked out"""
+        with self._lock:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
+                self._opened -= 1
+
+
+def import_json_storage(store, data_dir):
+    """One-time import of the JSON Lines / job files of the JSON fallback.
+
+    Each file is imported in its own transaction together with a row in
+    ``imported_files``, so an interrupted run never imports a file twice.
+    Returns the number of files imported.
+    """
+    bank_dir = os.path.join(data_dir, "question_bank")
+    jobs_dir = os.path.join(data_dir, "jobs")
+    candidates = []
+    if os.path.isdir(data_dir):
+        for name in sorted(os.listdir(data_dir)):
+            if name.startswith("quiz_results_") and name.endswith(".jsonl"):
+                candidates.append(('quiz_results', os.path.join(data_dir, name)))
+            elif name.startswith("flashcards_") and name.endswith(".jsonl"):
+                candidates.append(('flashcard_progress', os.path.join(data_dir, name)))
+    if os.path.isdir(bank_dir):
+        for name in sorted(os.listdir(bank_dir)):
+            if name.endswith(".jsonl"):
+                candidates.append(('question_bank', os.path.join(bank_dir, name)))
+    if os.path.isdir(jobs_dir):
+        for name in sorted(os.listdir(jobs_dir)):
+            if name.startswith("job_") and name.endswith(".json"):
+                candidates.append(('generation_jobs', os.path.join(jobs_dir, name)))
+
+    imported = 0
+    for table, path in candidates:
+        key = os.path.abspath(path)
+        try:
+            with store.transaction() as conn:
+                if conn.execute("SELECT 1 FROM imported_files WHERE path = ?", (key,)).fetchone():
+                    continue
+
+                if table == 'generation_jobs':
+                    with open(path, 'r') as f:
+                        store.upsert(conn, table, json.load(f), 'job_id')
+                elif table == 'flashcard_progress':
+                    snapshot = JsonlLog(path).last()
+                    if snapshot:
+                        store.upsert(conn, table, snapshot, 'user_id')
+                else:
+                    for record in JsonlLog(path):
+                        json_id = record.pop('_id', None)
+                        if table == 'quiz_results':
+                            # The JSON id is the result's stable id across backends
+                            record.setdefault('result_id', json_id or uuid.uuid4().hex)
+                        store.insert(conn, table, record)
+
+                conn.execute("INSERT INTO imported_files (path, imported_at) VALUES (?, ?)",
+                             (key, datetime.now().isoformat()))
+            imported += 1
+            print(f"Imported {path} into SQLite")
+        except Exception as e:
+            print(f"Error importing {path}: {e}")
+    return imported
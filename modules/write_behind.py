@@ -0,0 +1,143 @@
+# modules/write_behind.py
+import atexit
+import threading
+from collections import Counter
+
+
+class WriteBehindQueue:
+    """Buffers records and writes them in batches from a background thread.
+
+    ``write_batch(records)`` is called with up to ``max_batch`` records at a
+    time, at least every ``interval`` seconds or as soon as a full batch is
+    waiting. Records are tagged with a key (the user id) so readers can call
+    ``flush_key`` to see their own writes.
+
+    When a batch fails its records are retried one by one, so a single bad
+    record cannot hold back the others. Records that keep failing go back to
+    the front of the queue (the flusher backs off exponentially) until they
+    have failed ``max_attempts`` times, and are then handed to
+    ``dead_letter(failures)`` as ``(record, error)`` pairs. Everything still
+    pending is written, or dead-lettered, when the process exits.
+    """
+
+    def __init__(self, write_batch, interval=0.5, max_batch=100, name='write-behind',
+                 dead_letter=None, max_attempts=5):
+        self.write_batch = write_batch
+        self.interval = interval
+        self.max_batch = max_batch
+        self.dead_letter = dead_letter
+        self.max_attempts = max_attempts
+        self._pending = []
+        self._unflushed = Counter()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._released = threading.Event()
+        self._released.set()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, key, record):
+        """Queue one record for writing"""
+        with self._cond:
+            self._pending.append((key, record, 0))
+            self._unflushed[key] += 1
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def pending(self, key=None):
+        """Records queued or in flight, for one key or overall"""
+        with self._cond:
+            return self._unflushed[key] if key is not None else sum(self._unflushed.values())
+
+    def hold(self):
+        """Keep queued records unwritten until release() (e.g. while the backend is being chosen)"""
+        self._released.clear()
+
+    def release(self):
+        """Start writing again after hold()"""
+        self._released.set()
+        with self._cond:
+            self._cond.notify()
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._cond:
+                held = not self._released.is_set()
+                if (failures or held or len(self._pending) < self.max_batch) and not self._closed:
+                    self._cond.wait(self.interval * 2 ** min(failures, 6))
+                if self._closed:
+                    return
+            if self._released.is_set():
+                failures = 0 if self.flush() else failures + 1
+
+    def _write_each(self, batch):
+        """Write records one at a time; returns (written, failed with errors)"""
+        written, failed = [], []
+        for key, record, attempts in batch:
+            try:
+                self.write_batch([record])
+                written.append((key, record, attempts))
+            except Exception as e:
+                failed.append((key, record, attempts + 1, e))
+        return written, failed
+
+    def _send_to_dead_letter(self, failed):
+        print(f"Giving up on {len(failed)} records after repeated write errors: {failed[0][3]}")
+        if self.dead_letter is None:
+            return
+        try:
+            self.dead_letter([(record, error) for _, record, _, error in failed])
+        except Exception as e:
+            print(f"Error dead-lettering {len(failed)} records: {e}")
+
+    def flush(self, final=False):
+        """Write everything queued so far; returns False if a record had to be requeued.
+
+        With ``final`` nothing is requeued: what cannot be written now is dead-lettered.
+        While held, only a final flush writes anything.
+        """
+        if not final and not self._released.is_set():
+            return False
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = self._pending[:self.max_batch]
+                    del self._pending[:self.max_batch]
+                if not batch:
+                    return True
+
+                try:
+                    self.write_batch([record for _, record, _ in batch])
+                    written, failed = batch, []
+                except Exception as e:
+                    print(f"Error writing batch of {len(batch)} records: {e}")
+                    written, failed = self._write_each(batch)
+
+                retry = [(key, record, attempts) for key, record, attempts, _ in failed
+                         if attempts < self.max_attempts and not final]
+                dead = [item for item in failed if item[2] >= self.max_attempts or final]
+                if dead:
+                    self._send_to_dead_letter(dead)
+
+                with self._cond:
+                    self._pending[:0] = retry
+                    self._unflushed.subtract(item[0] for item in written + dead)
+                    self._unflushed += Counter()  # drop keys that reached zero
+                if retry:
+                    return False
+
+    def flush_key(self, key):
+        """Make this key's queued records visible to reads"""
+        if self.pending(key):
+            self.flush()
+
+    def close(self):
+        """Stop the background thread and write what is left"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush(final=True)
@@ -1,6 +1,17 @@
 # pages/1_📚_Flashcards.py
 import streamlit as st
-import PyPDF2
+import sys
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from modules.document_loader import extract_text
+from modules.retrieval_index import document_hash
+
+load_dotenv()
 
 st.set_page_config(
     page_title="Flashcard Manager",
@@ -126,16 +137,24 @@ with tab1:
     
     if uploaded_file is not None:
         # Extract text
-        if uploaded_file.type == "application/pdf":
-            pdf_reader = PyPDF2.PdfReader(uploaded_file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-        else:
-            text = uploaded_file.read().decode('utf-8')
+        text = extract_text(uploaded_file)
         
         st.success(f"✅ File uploaded! Extracted {len(text)} characters")
         
+        # Prepare practice questions in the background while the user studies
+        upload_hash = document_hash(text)
+        if os.getenv("GROQ_API_KEY") and st.session_state.get('queued_upload') != upload_hash and len(text.strip()) >= 50:
+            from modules.job_queue import get_job_queue
+            from modules.scheduler import QuotaExceeded
+            
+            user_id = st.session_state.setdefault('user_id', 'guest')
+            try:
+                if get_job_queue().enqueue(user_id, text, 'mcq', 5):
+                    st.info("⏳ Practice questions for this file are being prepared in the background.")
+            except QuotaExceeded:
+                pass
+            st.session_state.queued_upload = upload_hash
+        
         with st.expander("📄 View Extracted Content"):
             st.text_area("Content", text[:1000] + "...", height=200, disabled=True)
         
@@ -59,12 +59,15 @@ if not api_key:
 # Load generator
 try:
     from modules.question_generator import QuestionGenerator
+    from modules.database import get_database
+    from modules.scheduler import get_scheduler, content_cost, QuotaExceeded
     
     @st.cache_resource
     def load_generator():
-        return QuestionGenerator()
+        return QuestionGenerator(database=get_database())
     
     generator = load_generator()
+    scheduler = get_scheduler()
     st.success("✅ AI Model loaded successfully!")
     
 except Exception as e:
@@ -73,6 +76,8 @@ except Exception as e:
         st.code(str(e))
     st.stop()
 
+user_id = st.session_state.setdefault('user_id', 'guest')
+
 # Sidebar settings
 with st.sidebar:
     st.markdown("### ⚙️ Question Settings")
@@ -91,6 +96,19 @@ with st.sidebar:
         help="How many questions to generate"
     )
     
+    quality = st.select_slider(
+        "Speed vs. Quality",
+        options=["Fast", "Standard", "Best"],
+        value="Standard",
+        help="Faster settings may use a smaller model for simple question types"
+    )
+    tier = {"Fast": "fast", "Standard": "standard", "Best": "quality"}[quality]
+    
+    topic = st.text_input(
+        "Focus Topic (optional)",
+        help="For long documents, only the sections most relevant to this topic are used"
+    )
+    
     st.markdown("---")
     
     st.markdown("### 💡 Tips")
@@ -100,10 +118,59 @@ with st.sidebar:
     - Review generated questions before use
     - Try different question types
     """)
+    
+    user_queue = scheduler.user_stats(user_id)
+    st.caption(
+        f"🕒 Queued requests: {user_queue['queue_depth']} · "
+        f"Remaining quota: {user_queue['quota_remaining']}"
+        + (f" · Median wait: {user_queue['wait_seconds']['p50']:.1f}s" if user_queue['wait_seconds'] else "")
+    )
+    
+    with st.expander("📈 Generation Metrics"):
+        cache_stats = generator.semantic_cache.stats()
+        st.metric(
+            "LLM Calls Saved",
+            cache_stats['hits'],
+            delta=f"{cache_stats['hit_rate'] * 100:.0f}% cache hit rate",
+            delta_color="off"
+        )
+        st.download_button(
+            "Download JSON",
+            data=generator.metrics.to_json(),
+            file_name="generation_metrics.json",
+            mime="application/json",
+            use_container_width=True
+        )
+        if generator.router.stats:
+            st.json(generator.router.summary())
+        st.download_button(
+            "Download Prometheus",
+            data=generator.metrics.to_prometheus(),
+            file_name="generation_metrics.prom",
+            mime="text/plain",
+            use_container_width=True
+        )
 
 # Main content area
 st.markdown("### 📄 Study Material Input")
 
+# File upload
+uploaded_file = st.file_uploader(
+    "Upload a PDF or TXT file (optional)",
+    type=['pdf', 'txt'],
+    help="Large documents are indexed so questions can target a specific topic"
+)
+
+uploaded_content = ""
+if uploaded_file is not None:
+    from modules.document_loader import extract_text
+    from modules.retrieval_index import get_index_store
+    
+    uploaded_content = extract_text(uploaded_file)
+    # Build (or load) the topic index up front so topic queries are instant
+    get_index_store().get_or_build(uploaded_content)
+    st.success(f"✅ File uploaded! Extracted {len(uploaded_content)} characters")
+
 # Text input
 study_content = st.text_area(
     "Paste your study material here:",
@@ -116,6 +183,9 @@ Photosynthesis is the process by which green plants use sunlight to synthesize n
     help="The more detailed your content, the better the questions"
 )
 
+if uploaded_content and not study_content:
+    study_content = uploaded_content
+
 # Show statistics
 if study_content:
     word_count = len(study_content.split())
@@ -148,6 +218,41 @@ with col_btn2:
         type="primary",
         use_container_width=True
     )
+    background_clicked = st.button(
+        "⏳ Generate in Background",
+        use_container_width=True,
+        help="Keep studying while questions are prepared"
+    )
+
+QUESTION_TYPE_KEYS = {"Multiple Choice": "mcq", "True/False": "tf", "Short Answer": "sa"}
+
+# Queue a background job
+if background_clicked:
+    if not study_content or len(study_content.strip()) < 50:
+        st.error("❌ Please enter at least 50 characters of study material")
+    else:
+        from modules.job_queue import get_job_queue
+        
+        try:
+            job_id = get_job_queue().enqueue(
+                user_id, study_content, QUESTION_TYPE_KEYS[question_type], num_questions, topic=topic
+            )
+            if job_id:
+                st.info("⏳ Questions are being prepared in the background. Check the status below.")
+            else:
+                st.error("❌ Could not queue the generation job. Please try again.")
+        except QuotaExceeded as e:
+            st.error(f"⏱️ You've reached your generation limit. Please try again in {e.retry_after / 60:.0f} minutes.")
+
+def run_generation(q_key):
+    """Generate through the fair scheduler so one user cannot starve the rest"""
+    return scheduler.run(
+        user_id,
+        generator.generate,
+        (study_content, q_key, num_questions),
+        {'topic': topic, 'user_id': user_id, 'tier': tier},
+        cost=content_cost(study_content)
+    )
 
 # Generate questions
 if generate_clicked:
@@ -166,24 +271,30 @@ if generate_clicked:
             if question_type == "Multiple Choice":
                 status_text.text("🎯 Creating multiple choice questions...")
                 progress_bar.progress(50)
-                questions = generator.generate_mcq(study_content, num_questions)
+                questions = run_generation('mcq')
                 q_type = "mcq"
                 
             elif question_type == "True/False":
                 status_text.text("✓ Creating true/false questions...")
                 progress_bar.progress(50)
-                questions = generator.generate_true_false(study_content, num_questions)
+                questions = run_generation('tf')
                 q_type = "tf"
                 
             else:  # Short Answer
                 status_text.text("✍️ Creating short answer questions...")
                 progress_bar.progress(50)
-                questions = generator.generate_short_answer(study_content, num_questions)
+                questions = run_generation('sa')
                 q_type = "sa"
             
             progress_bar.progress(75)
             status_text.text("✨ Finalizing questions...")
             
+            if generator.breaker.state == "open":
+                st.warning(
+                    f"⚠️ The AI service is currently unavailable. Showing previously generated questions "
+                    f"for this material where possible. Try again in {generator.breaker.retry_after():.0f} seconds."
+                )
+            
             if questions and len(questions) > 0:
                 progress_bar.progress(100)
                 status_text.empty()
@@ -272,6 +383,11 @@ if generate_clicked:
                 status_text.empty()
                 st.error("❌ Failed to generate questions. Please try different content or try again.")
                 
+        except QuotaExceeded as e:
+            progress_bar.empty()
+            status_text.empty()
+            st.error(f"⏱️ You've reached your generation limit. Please try again in {e.retry_after / 60:.0f} minutes.")
+            
         except Exception as e:
             progress_bar.empty()
             status_text.empty()
@@ -293,4 +409,36 @@ if 'generated_questions' in st.session_state and st.session_state.get('generated
     with col_action2:
         if st.button("🔄 Clear Saved Questions", use_container_width=True):
             del st.session_state['generated_questions']
-            st.rerun()
\ No newline at end of file
+            st.rerun()
+
+# Background jobs
+from modules.job_queue import get_job_queue
+
+jobs = get_job_queue().user_jobs(user_id, limit=5)
+if jobs:
+    st.markdown("---")
+    st.markdown("### ⏳ Background Jobs")
+    
+    if st.button("🔄 Refresh Status"):
+        st.rerun()
+    
+    status_icons = {'queued': '🕒', 'running': '⚙️', 'done': '✅', 'failed': '❌'}
+    type_labels = {v: k for k, v in QUESTION_TYPE_KEYS.items()}
+    
+    for job in jobs:
+        job_col1, job_col2 = st.columns([3, 1])
+        
+        with job_col1:
+            st.markdown(
+                f"{status_icons.get(job['status'], '❓')} **{type_labels.get(job['question_type'], job['question_type'])}** "
+                f"· {job['num_questions']} questions · {job['status']} · {job['created_at'][:16].replace('T', ' ')}"
+            )
+            if job['status'] == 'failed' and job.get('error'):
+                st.caption(job['error'])
+        
+        with job_col2:
+            if job['status'] == 'done':
+                if st.button("📝 Use Questions", key=f"use_job_{job['job_id']}", use_container_width=True):
+                    st.session_state['generated_questions'] = job['questions']
+                    st.session_state['question_type'] = job['question_type']
+                    st.rerun()
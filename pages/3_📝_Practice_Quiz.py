@@ -8,6 +8,7 @@ import time
 sys.path.append(str(Path(__file__).parent.parent))
 
 from modules.answer_evaluator import AnswerEvaluator
+from modules.database import get_database
 
 # Page config
 st.set_page_config(
@@ -216,6 +217,8 @@ if 'correct_streak' not in st.session_state:
     st.session_state.correct_streak = 0
 if 'max_streak' not in st.session_state:
     st.session_state.max_streak = 0
+if 'quiz_saved' not in st.session_state:
+    st.session_state.quiz_saved = False
 
 # Header
 st.markdown("""
@@ -295,6 +298,7 @@ if not st.session_state.quiz_started:
             st.session_state.quiz_completed = False
             st.session_state.correct_streak = 0
             st.session_state.max_streak = 0
+            st.session_state.quiz_saved = False
             st.rerun()
 
 # Quiz in progress
@@ -571,6 +575,23 @@ else:
     mins = time_taken // 60
     secs = time_taken % 60
     
+    # Save the attempt once (feeds the Progress Dashboard)
+    if not st.session_state.quiz_saved and scores:
+        user_id = st.session_state.setdefault('user_id', 'guest')
+        answered_idx = [idx for idx in range(total_questions) if idx in st.session_state.user_answers]
+        # Short-answer scores are numpy floats, which no storage backend can encode
+        saved = get_database().save_quiz_result(
+            user_id,
+            [questions[idx] for idx in answered_idx],
+            [st.session_state.user_answers[idx] for idx in answered_idx],
+            [float(score) for score in scores],
+            float(avg_score),
+            time_spent=time_taken
+        )
+        if not saved:
+            st.warning("⚠️ This attempt could not be saved to your progress.")
+        st.session_state.quiz_saved = True
+    
     # Results page
     st.markdown("""
     <div class="score-card">
@@ -691,6 +712,7 @@ else:
             st.session_state.quiz_completed = False
             st.session_state.start_time = None
             st.session_state.correct_streak = 0
+            st.session_state.quiz_saved = False
             st.rerun()
     
     with action_col2:
@@ -6,6 +6,13 @@ import plotly.express as px
 from datetime import datetime, timedelta
 import json
 import os
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from modules.database import get_database
 
 st.set_page_config(
     page_title="Progress Dashboard",
@@ -22,24 +29,52 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# Mock data for demonstration
-# In real implementation, this would come from saved user data
+user_id = st.session_state.setdefault('user_id', 'guest')
+database = get_database()
 
-def generate_mock_data():
-    """Generate sample progress data"""
-    dates = pd.date_range(end=datetime.now(), periods=14, freq='D')
-    
-    data = {
-        'date': dates,
-        'questions_answered': [12, 15, 8, 20, 18, 22, 16, 25, 19, 21, 17, 23, 20, 24],
-        'accuracy': [65, 70, 68, 75, 72, 78, 76, 80, 82, 79, 81, 83, 85, 87],
-        'time_spent': [25, 30, 20, 40, 35, 45, 38, 50, 42, 48, 40, 52, 45, 55]
-    }
+def load_progress_data(user_id, start_date, end_date):
+    """Daily progress from the per-day rollups (one small record per active day)"""
+    rollups = database.get_daily_rollups(user_id, start_date, end_date)
+    daily = pd.DataFrame(rollups, columns=['day', 'quizzes', 'questions_answered', 'score_sum', 'time_spent'])
+    daily.index = pd.to_datetime(daily['day'])
+    daily = daily.reindex(pd.date_range(start_date, end_date, freq='D'), fill_value=0)
     
-    return pd.DataFrame(data)
+    return pd.DataFrame({
+        'date': daily.index,
+        'quizzes': daily['quizzes'].astype(int).values,
+        'questions_answered': daily['questions_answered'].astype(int).values,
+        'accuracy': (daily['score_sum'] / daily['quizzes'].where(daily['quizzes'] > 0)).round(1).values,
+        'time_spent': (daily['time_spent'] / 60).round().astype(int).values
+    })
+
+def current_streak(user_id, today):
+    """Consecutive days up to today (or yesterday) with at least one quiz"""
+    active = {r['day'] for r in database.get_daily_rollups(user_id, today - timedelta(days=365), today)}
+    day = today if today.isoformat() in active else today - timedelta(days=1)
+    streak = 0
+    while day.isoformat() in active:
+        streak += 1
+        day -= timedelta(days=1)
+    return streak
+
+# Date range
+today = datetime.now().date()
+date_range = st.date_input(
+    "Date range",
+    value=(today - timedelta(days=13), today),
+    max_value=today
+)
+if isinstance(date_range, (list, tuple)):
+    start_date, end_date = (date_range[0], date_range[-1]) if date_range else (today, today)
+else:
+    start_date = end_date = date_range
 
 # Get data
-df = generate_mock_data()
+df = load_progress_data(user_id, start_date, end_date)
+active_days = df[df['quizzes'] > 0]
+
+if active_days.empty:
+    st.info("No quizzes in this date range yet. Finish a Practice Quiz to start tracking your progress!")
 
 # Summary statistics
 st.markdown("### 📈 Overall Performance")
@@ -51,12 +86,13 @@ with col1:
     st.metric(
         "Total Questions",
         f"{total_questions}",
-        delta=f"+{df['questions_answered'].iloc[-1]} today"
+        delta=f"+{df['questions_answered'].iloc[-1]} on {end_date.strftime('%b %d')}"
     )
 
 with col2:
-    avg_accuracy = df['accuracy'].mean()
-    accuracy_trend = df['accuracy'].iloc[-1] - df['accuracy'].iloc[-2]
+    # Quiz-weighted average over the range; trend between the last two active days
+    avg_accuracy = (active_days['accuracy'] * active_days['quizzes']).sum() / max(active_days['quizzes'].sum(), 1)
+    accuracy_trend = active_days['accuracy'].iloc[-1] - active_days['accuracy'].iloc[-2] if len(active_days) > 1 else 0
     st.metric(
         "Average Accuracy",
         f"{avg_accuracy:.1f}%",
@@ -68,11 +104,11 @@ with col3:
     st.metric(
         "Total Study Time",
         f"{total_time} mins",
-        delta=f"+{df['time_spent'].iloc[-1]} mins today"
+        delta=f"+{df['time_spent'].iloc[-1]} mins on {end_date.strftime('%b %d')}"
     )
 
 with col4:
-    streak = 14  # Mock data
+    streak = current_streak(user_id, today)
     st.metric(
         "Current Streak",
         f"{streak} days",
@@ -116,6 +152,7 @@ with col_chart2:
         mode='lines+markers',
         line=dict(color='#38ef7d', width=3),
         marker=dict(size=8),
+        connectgaps=True,
         fill='tozeroy',
         fillcolor='rgba(56, 239, 125, 0.2)'
     ))
@@ -161,10 +198,13 @@ with col_time1:
     st.plotly_chart(fig3, use_container_width=True)
 
 with col_time2:
-    # Weekly breakdown
+    # Weekly breakdown of the last 7 days in the range
+    weekdays = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    last_week = df.tail(7)
+    minutes_by_day = last_week.groupby(last_week['date'].dt.day_name().str[:3])['time_spent'].sum()
     weekly_data = pd.DataFrame({
-        'Day': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
-        'Minutes': [45, 52, 38, 55, 42, 60, 48]
+        'Day': weekdays,
+        'Minutes': [int(minutes_by_day.get(day, 0)) for day in weekdays]
     })
     
     fig4 = go.Figure()
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+import modules.database as database
+from modules.database import Database
+from modules.jsonl_log import JsonlLog
+
+
+@pytest.fixture
+def json_db(workdir, monkeypatch):
+    monkeypatch.setenv('LOCAL_STORAGE', 'json')
+    monkeypatch.delenv('MONGODB_URI', raising=False)
+    # Flush by hand instead of from the background thread
+    monkeypatch.setattr(database, 'QUIZ_WRITE_BEHIND_INTERVAL', 60)
+    db = Database()
+    yield db
+    db.quiz_writes.close()
+
+
+def test_partial_batch_failure_writes_each_result_once(json_db, monkeypatch):
+    real_append = JsonlLog.append_many
+    failures = []
+
+    def fail_once_for_b(self, records):
+        if self.path.endswith("quiz_results_b.jsonl") and not failures:
+            failures.append(self.path)
+            raise OSError("disk full")
+        return real_append(self, records)
+
+    monkeypatch.setattr(JsonlLog, 'append_many', fail_once_for_b)
+    assert json_db.save_quiz_result('a', [1], [1], [1.0], 100.0)
+    assert json_db.save_quiz_result('b', [1], [1], [1.0], 50.0)
+    json_db.quiz_writes.flush()
+
+    assert failures
+    assert json_db.quiz_writes.pending() == 0
+    for user_id in ('a', 'b'):
+        assert len(json_db.get_quiz_history(user_id)) == 1
+        assert json_db.get_user_stats(user_id)['total_quizzes'] == 1
+
+
+def quiz_records(user_id, completed_at):
+    return [{'user_id': user_id, 'questions_count': 1, 'answers': [i], 'scores': [1.0],
+             'total_score': float(i), 'time_spent': 1.0, 'completed_at': at,
+             'result_id': f"{user_id}-{i}"}
+            for i, at in enumerate(completed_at)]
+
+
+def test_import_keeps_results_that_share_a_timestamp(json_db, workdir):
+    same = '2026-01-01T10:00:00'
+    times = [same] * 7 + [f'2026-01-0{day}T09:00:00' for day in range(2, 7)]
+    json_db._write_quiz_results(quiz_records('a', times))
+
+    path = str(workdir / "a.ndjson")
+    assert json_db.export_user_data('a', path)['quiz_result'] == 12
+
+    json_db.import_user_data(path, user_id='b')
+    json_db.import_user_data(path, user_id='b')
+    json_db.import_user_data(path)
+
+    assert len(json_db.get_quiz_history('b', limit=50)) == 12
+    assert json_db.get_user_stats('b')['total_quizzes'] == 12
+    assert len(json_db.get_quiz_history('a', limit=50)) == 12
+
+
+def test_import_of_export_without_ids_uses_natural_key(json_db, workdir):
+    path = workdir / "old.ndjson"
+    records = quiz_records('c', ['2026-01-01T10:00:00', '2026-01-02T10:00:00'])
+    with open(path, 'w') as f:
+        for record in records:
+            record.pop('result_id')
+            f.write(json.dumps({'type': 'quiz_result', 'data': record}) + "\n")
+
+    json_db.import_user_data(str(path))
+    json_db.import_user_data(str(path))
+
+    history = json_db.get_quiz_history('c', limit=50)
+    assert len(history) == 2
+    assert all(result['result_id'] for result in history)
@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+import modules.jsonl_log as jsonl_log
+from modules.jsonl_log import JsonlLog, migrate_json_file
+
+
+def test_interrupted_migration_is_not_appended_twice(workdir, monkeypatch):
+    source = workdir / "quiz_results_u.json"
+    source.write_text(json.dumps([{'user_id': 'u', 'n': i} for i in range(2500)]))
+    target = str(source) + "l"
+
+    real_iter = jsonl_log.iter_json_array
+
+    def crash_after_first_batch(path):
+        for i, record in enumerate(real_iter(path)):
+            if i == 1000:
+                raise KeyboardInterrupt("killed")
+            yield record
+
+    monkeypatch.setattr(jsonl_log, 'iter_json_array', crash_after_first_batch)
+    with pytest.raises(KeyboardInterrupt):
+        migrate_json_file(str(source), target)
+    assert source.exists()
+
+    monkeypatch.setattr(jsonl_log, 'iter_json_array', real_iter)
+    assert migrate_json_file(str(source), target)
+
+    records = list(JsonlLog(target))
+    assert [r['n'] for r in records] == list(range(2500))
+    assert not source.exists()
+    assert (workdir / "quiz_results_u.json.migrated").exists()
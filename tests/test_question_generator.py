@@ -0,0 +1,68 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import modules.circuit_breaker as circuit_breaker
+import modules.semantic_cache as semantic_cache
+from modules.question_generator import QuestionGenerator
+
+
+class FakeLLM:
+    """Streams one question per requested slot, tagged with the topics in the prompt"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def stream(self, prompt):
+        self.prompts.append(prompt)
+        count = int(prompt.split('Generate ')[1].split()[0])
+        topics = [t for t in ('photosynthesis', 'mitochondria') if t in prompt.lower()]
+        questions = [{'question': f"{'/'.join(topics)} {len(self.prompts)}-{i}",
+                      'options': {'A': 'a', 'B': 'b', 'C': 'c', 'D': 'd'},
+                      'correct_answer': 'A'} for i in range(count)]
+        yield SimpleNamespace(content=json.dumps(questions), usage_metadata=None)
+
+
+@pytest.fixture
+def generator(workdir, monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'test')
+    monkeypatch.setattr(semantic_cache, '_semantic_cache', None)
+    monkeypatch.setattr(circuit_breaker, '_breakers', {})
+    gen = QuestionGenerator(hedging=False)
+    llm = FakeLLM()
+    gen._llm_for = lambda model: llm
+    return gen, llm
+
+
+NOTES = "\n\n".join(
+    f"Photosynthesis note {i}: chlorophyll in the leaf absorbs light and the plant "
+    f"turns carbon dioxide and water into glucose, releasing oxygen as a by-product."
+    for i in range(10)
+)
+PARAGRAPH = ("Mitochondria are the site of cellular respiration, where glucose is broken "
+             "down to release energy stored as ATP for the rest of the cell to use.")
+
+
+def test_appended_paragraph_is_not_served_from_semantic_cache(generator):
+    gen, llm = generator
+    assert 1400 < len(NOTES) < 1600
+
+    first = gen.generate(NOTES, 'mcq', num_questions=5)
+    assert first and llm.prompts
+    calls = len(llm.prompts)
+
+    revised = gen.generate(NOTES + "\n\n" + PARAGRAPH, 'mcq', num_questions=5)
+
+    assert len(llm.prompts) > calls
+    assert all('Mitochondria' in prompt for prompt in llm.prompts[calls:])
+    assert any('mitochondria' in q['question'] for q in revised)
+
+
+def test_unchanged_notes_make_no_llm_calls(generator):
+    gen, llm = generator
+    gen.generate(NOTES, 'mcq', num_questions=5)
+    calls = len(llm.prompts)
+
+    assert gen.generate(NOTES, 'mcq', num_questions=5)
+    assert len(llm.prompts) == calls